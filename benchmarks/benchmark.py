@@ -0,0 +1,228 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import pygame
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# Reproducible performance benchmark. Each scenario loads world.tmx in a headless game, places a fixed horde of
+# enemies (equal parts normal, fast and tank, at seeded random positions), keeps the player firing in a slowly
+# turning circle, and runs a fixed number of frames of update + collision + draw with a fixed time step.
+#
+#   python benchmarks/benchmark.py                       # the standard 100 / 500 / 2000 enemy scenarios
+#   python benchmarks/benchmark.py --enemies 500 --frames 600 --out after.json --compare before.json
+#   python benchmarks/benchmark.py --replay session.bin   # a recorded game (python main.py --record session.bin)
+#   python benchmarks/benchmark.py --snapshot wave20.snap # a saved game (python main.py --wave 20 --checkpoint ...)
+#
+# A replay scenario plays the recorded game from start to end instead, with its own input and enemy spawns,
+# so the frames of a real session can be measured and compared between commits like the fixed hordes.
+# A snapshot scenario carries on from the saved game with the firing player, enemies spawning as in that game.
+#
+# Every scenario runs in its own fresh process, so peak RSS is not shared between them.
+#
+# Allocation churn is measured after the timed frames, by running --churn-frames more frames (a replay is played
+# again from the start instead) under tracemalloc, which would slow the timed frames down. allocated_bytes_per_frame
+# is how far traced memory rose above where it was when the frame started: the memory a frame allocates and frees
+# again, such as new vectors, rects and lists, shows up here even though the frame ends where it started.
+# net_allocated_blocks_per_frame is how much the number of live memory blocks changed over a timed frame. It stays
+# near 0 in a steady state however much is allocated and freed, so it shows leaks and growth, not churn.
+# Results are JSON with the git commit they were measured on, so runs from different commits can be compared.
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code')
+DEFAULT_ENEMIES = (100, 500, 2000)
+
+# Player input for the benchmark: stand still and keep firing while the aim turns a little every frame
+class FiringController:
+    def __init__(self):
+        self.angle = 0
+
+    def reset(self):
+        self.angle = 0
+
+    def movement(self):
+        return pygame.Vector2()
+
+    def aim(self):
+        self.angle = (self.angle + 3) % 360
+        return pygame.Vector2(1, 0).rotate(self.angle)
+
+    def firing(self):
+        return True
+
+def percentile(values, point):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * point / 100))]
+
+def summarize(values):
+    return {
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p99': percentile(values, 99),
+    }
+
+# Run one scenario in the current process and return its results
+def run_scenario(enemies, frames, warmup, seed, churn_frames, replay_path = None, snapshot_path = None):
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    replay_path = replay_path and os.path.abspath(replay_path)
+    snapshot_path = snapshot_path and os.path.abspath(snapshot_path)
+    sys.path.insert(0, CODE_DIR)
+    os.chdir(CODE_DIR)
+    import resource
+    from main import Game
+    from sprites import Enemy
+    from replay import load_replay
+
+    # Enemies the game already had before the horde was added (those of a snapshot)
+    restored_enemies = 0
+    if replay_path:
+        # Every step of the recorded game is measured
+        game = Game(headless = True, replay = load_replay(replay_path))
+        frames, warmup, enemies, seed = game.replay.steps, 0, 0, game.seed
+    elif snapshot_path:
+        game = Game(headless = True, controller = FiringController())
+        game.load_snapshot(snapshot_path)
+        # The snapshot's enemies are the horde, so none are added
+        enemies, seed = 0, game.seed
+        restored_enemies = len(game.enemy_sprites)
+    else:
+        game = Game(headless = True, controller = FiringController(), seed = seed)
+        # The horde is fixed, so no enemies are spawned during the run
+        game.set_spawn_interval(float('inf'))
+
+    rng = game.rng
+    map_width, map_height = game.all_sprites.terrain.size
+    enemy_types = ['normal', 'fast', 'tank']
+    for number in range(enemies):
+        enemy_frames, enemy_masks, death_surf = game.enemy_kind(rng.choice(game.enemy_folders))
+        pos = (rng.uniform(0, map_width), rng.uniform(0, map_height))
+        Enemy(pos, enemy_frames, enemy_masks, death_surf,
+              (game.all_sprites, game.enemy_sprites), game.player, game.collision_grid, enemy_types[number % 3], game.enemy_engine, game.flow_field)
+
+    profiler = game.profiler
+    def run_frame():
+        profiler.start_frame()
+        game.step()
+        game.display_surface.fill('black')
+        game.all_sprites.draw(game.player.rect.center)
+        game.draw_ui()
+        profiler.mark('draw')
+
+    frame_times, phase_times, block_growth = [], {}, []
+    for frame in range(warmup + frames):
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        run_frame()
+        if frame >= warmup:
+            frame_times.append((time.perf_counter() - start) * 1000)
+            block_growth.append(sys.getallocatedblocks() - blocks)
+            for phase, duration in profiler.timings.items():
+                phase_times.setdefault(phase, []).append(duration)
+
+    # The recorded game has ended, so its churn is measured by playing it again
+    if replay_path and churn_frames:
+        game.reset_game(game.seed)
+        churn_frames = frames
+    allocated = []
+    tracemalloc.start()
+    for frame in range(churn_frames):
+        traced = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        run_frame()
+        allocated.append(tracemalloc.get_traced_memory()[1] - traced)
+    tracemalloc.stop()
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+    return {
+        'name': os.path.basename(replay_path or snapshot_path) if replay_path or snapshot_path else f'{enemies} enemies',
+        'enemies': enemies,
+        'restored_enemies': restored_enemies,
+        'frames': frames,
+        'seed': seed,
+        'frame_ms': summarize(frame_times),
+        'phase_ms': {phase: summarize(times) for phase, times in phase_times.items()},
+        'allocated_bytes_per_frame': summarize(allocated) if allocated else None,
+        'net_allocated_blocks_per_frame': sum(block_growth) / frames,
+        'enemies_left': len(game.enemy_sprites),
+        'peak_rss_mb': peak_rss_mb,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = CODE_DIR, capture_output = True, text = True).stdout.strip() or None
+    except OSError:
+        return None
+
+# Results from before replays could be benchmarked have no name
+def scenario_name(scenario):
+    return scenario.get('name', f"{scenario['enemies']} enemies")
+
+# Print the change in the main numbers of every scenario that is in both result files
+def compare(before, after):
+    old = {scenario_name(scenario): scenario for scenario in before['scenarios']}
+    for scenario in after['scenarios']:
+        base = old.get(scenario_name(scenario))
+        if not base:
+            continue
+        print(f"{scenario_name(scenario)} ({before['commit']} -> {after['commit']})")
+        for name in ('p50', 'p99'):
+            change = (scenario['frame_ms'][name] / base['frame_ms'][name] - 1) * 100
+            print(f"  frame {name}: {base['frame_ms'][name]:8.2f} -> {scenario['frame_ms'][name]:8.2f} ms  ({change:+.1f}%)")
+        for phase, times in scenario['phase_ms'].items():
+            if phase in base['phase_ms']:
+                print(f"  {phase:<18} {base['phase_ms'][phase]['mean']:8.2f} -> {times['mean']:8.2f} ms")
+        if base.get('allocated_bytes_per_frame') and scenario['allocated_bytes_per_frame']:
+            print(f"  allocated per frame: {base['allocated_bytes_per_frame']['mean'] / 1024:8.1f} -> "
+                  f"{scenario['allocated_bytes_per_frame']['mean'] / 1024:8.1f} KB")
+        print(f"  peak rss: {base['peak_rss_mb']:8.1f} -> {scenario['peak_rss_mb']:8.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Measure update, collision and draw time under fixed enemy hordes.')
+    parser.add_argument('--enemies', type = int, action = 'append', help = 'horde size, can be repeated (default: 100, 500 and 2000)')
+    parser.add_argument('--frames', type = int, default = 300, help = 'measured frames per scenario')
+    parser.add_argument('--warmup', type = int, default = 30, help = 'frames run before measuring')
+    parser.add_argument('--seed', type = int, default = 1)
+    parser.add_argument('--churn-frames', type = int, default = 60, help = 'frames run under tracemalloc after the measured ones, 0 to skip')
+    parser.add_argument('--out', default = '-', help = "JSON file to write, or '-' for stdout")
+    parser.add_argument('--compare', metavar = 'JSON', help = 'earlier result file to compare against')
+    parser.add_argument('--replay', metavar = 'PATH', action = 'append', default = [], help = 'recorded game to play as a scenario, can be repeated (runs instead of the standard hordes unless --enemies is given)')
+    parser.add_argument('--snapshot', metavar = 'PATH', action = 'append', default = [], help = 'saved game to carry on from as a scenario, can be repeated (like --replay)')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    hordes = args.enemies or ([] if args.replay or args.snapshot else DEFAULT_ENEMIES)
+    runs = [(enemies, args.frames, args.warmup, args.seed, args.churn_frames) for enemies in hordes]
+    runs += [(0, 0, 0, None, args.churn_frames, replay_path) for replay_path in args.replay]
+    runs += [(0, args.frames, args.warmup, None, args.churn_frames, None, snapshot_path) for snapshot_path in args.snapshot]
+    scenarios = []
+    for run in runs:
+        pool = context.Pool(1)
+        scenarios.append(pool.apply(run_scenario, run))
+        pool.close()
+        pool.join()
+        print(f"{scenarios[-1]['name']}: p50 {scenarios[-1]['frame_ms']['p50']:.2f} ms, p99 {scenarios[-1]['frame_ms']['p99']:.2f} ms", file = sys.stderr)
+
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scenarios': scenarios,
+    }
+    if args.out == '-':
+        print(json.dumps(results, indent = 2))
+    else:
+        with open(args.out, 'w') as file:
+            json.dump(results, file, indent = 2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+from settings import *
+import pygame.freetype
+from mapcache import load_world, file_stat
+from utils import get_asset_path
+from concurrent.futures import Future
+from heapq import heappush, heappop
+import json
+import os
+import threading
+
+# Process-wide asset cache. Every image is decoded and scaled once per (path, size, scale) and then shared,
+# so new sprites and new games (play again) reuse the same surfaces instead of reading the files again.
+# The cache only grows with the number of distinct assets, not with the number of games played.
+_images = {}
+_masks = {}
+_rotations = {}
+_fonts = {}
+_maps = {}
+_atlases = {}
+_atlas_index = {}
+
+# Pre-scaled image atlases written by build_atlas.py, and index.json that tells where each image is in them
+ATLAS_DIR = get_asset_path('images', 'atlas')
+ATLAS_INDEX_PATH = os.path.join(ATLAS_DIR, 'index.json')
+# Bump this when the layout of index.json changes
+ATLAS_VERSION = 1
+
+# Assets some thread is building right now, as (cache id, key): Event set once it is done. _lock guards it.
+_loading = {}
+_lock = threading.Lock()
+
+# Priorities for AssetLoader.request. Lower numbers load first.
+GAME_SETUP = 0
+LATER = 1
+RARELY = 2
+
+# cache[key], built with build() the first time. The game and the loader thread can ask for the same asset
+# at once: the first one builds it and the other waits for it instead of decoding it a second time. A
+# failed build is not cached, so the waiting thread then tries (and fails) on its own.
+def _cached(cache, key, build):
+    loading_key = (id(cache), key)
+    while key not in cache:
+        with _lock:
+            if key in cache:
+                break
+            event = _loading.get(loading_key)
+            building = event is None
+            if building:
+                event = _loading[loading_key] = threading.Event()
+        if not building:
+            event.wait()
+            continue
+        try:
+            cache[key] = build()
+        finally:
+            with _lock:
+                del _loading[loading_key]
+            event.set()
+    return cache[key]
+
+# Decode one image file and resize or scale it, without the cache
+def read_image(path, size = None, scale = None):
+    surf = pygame.image.load(path).convert_alpha()
+    if size:
+        surf = pygame.transform.scale(surf, size)
+    elif scale:
+        surf = pygame.transform.scale(surf, (int(surf.get_width() * scale), int(surf.get_height() * scale)))
+    return surf
+
+# Load an image with alpha, optionally resized to size (width, height) or scaled by a factor.
+# The returned surface is shared, so callers must not draw on it.
+# It comes from an atlas when one has this image at this size, and from its own file otherwise.
+def load_image(path, size = None, scale = None):
+    return _cached(_images, (path, size, scale), lambda: _atlas_image(path, size, scale) or read_image(path, size, scale))
+
+# The atlas index as (path, size, scale): (atlas file, rect, size and mtime of the source file when the atlas was
+# built). Empty when there is no index, or it is from another version of the game.
+def load_atlas_index():
+    return _cached(_atlas_index, ATLAS_INDEX_PATH, _read_atlas_index)
+
+def _read_atlas_index():
+    try:
+        with open(ATLAS_INDEX_PATH) as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != ATLAS_VERSION:
+        return {}
+    index = {}
+    for atlas in data['atlases']:
+        for image in atlas['images']:
+            path = get_asset_path(*image['path'].split('/'))
+            size = tuple(image['size']) if image['size'] else None
+            index[(path, size, image['scale'])] = (atlas['file'], tuple(image['rect']), tuple(image['source']))
+    return index
+
+# A subsurface of the atlas that holds the image at this size, or None if no atlas does. An image whose file has
+# changed since the atlas was built is read from its file instead, so an out of date atlas is only slower.
+def _atlas_image(path, size, scale):
+    entry = load_atlas_index().get((path, size, scale))
+    if entry is None:
+        return None
+    file_name, rect, source = entry
+    if file_stat(path) != source:
+        return None
+    atlas = _cached(_atlases, file_name, lambda: pygame.image.load(os.path.join(ATLAS_DIR, file_name)).convert_alpha())
+    return atlas.subsurface(rect)
+
+# Collision mask of the image load_image returns for the same arguments
+def load_mask(path, size = None, scale = None):
+    return _cached(_masks, (path, size, scale), lambda: pygame.mask.from_surface(load_image(path, size, scale)))
+
+# Rotated (and flipped) copies of one image, so sprites that turn every frame look a surface up instead of
+# resampling it. Angles are snapped to steps of 360 / steps degrees, and each step is only rotated the first
+# time it is asked for.
+class RotationCache:
+    def __init__(self, surf, steps = ROTATION_STEPS):
+        self.surf = surf
+        self.steps = steps
+        self.images = {}
+
+    # The image rotated counterclockwise by angle degrees like rotozoom does, then flipped upside down if flip
+    def get(self, angle, flip = False):
+        step = round(angle * self.steps / 360) % self.steps
+        key = (step, flip)
+        if key not in self.images:
+            image = pygame.transform.rotozoom(self.surf, step * 360 / self.steps, 1)
+            if flip:
+                image = pygame.transform.flip(image, False, True)
+            self.images[key] = image
+        return self.images[key]
+
+# The shared RotationCache of the image load_image returns for the same arguments
+def load_rotations(path, size = None, scale = None):
+    return _cached(_rotations, (path, size, scale), lambda: RotationCache(load_image(path, size, scale)))
+
+# Fonts by (name, size, bold). A name is looked up as a system font with pygame.freetype, which searches the
+# system font list and is slow where there are many fonts, so each one is only looked up once.
+# Without a name it is pygame's default font as a pygame.font.Font.
+def load_font(size, name = None, bold = False):
+    if name:
+        return _cached(_fonts, (name, size, bold), lambda: pygame.freetype.SysFont(name, size, bold = bold))
+    return _cached(_fonts, (name, size, bold), lambda: pygame.font.Font(None, size))
+
+# Load a Tiled map once, through the binary map cache. The map objects and their images are only read
+# when building sprites.
+def load_map(path):
+    return _cached(_maps, path, lambda: load_world(path))
+
+# A load queued with AssetLoader.request. result() returns what the load returned: at once if the loader has
+# finished it, after waiting if the loader is busy with it, or by running it on the calling thread right now
+# if the loader has not got to it yet.
+class AssetTask:
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.started = False
+        self.future = Future()
+
+    def run(self):
+        with _lock:
+            if self.started:
+                return
+            self.started = True
+        try:
+            self.future.set_result(self.function(*self.args))
+        except BaseException as error:
+            self.future.set_exception(error)
+
+    def result(self):
+        self.run()
+        return self.future.result()
+
+# Background thread that loads ahead of time, most urgent request first, so the window can open and respond
+# while the game is still loading. Loads go through the same caches as everything else, so the game never
+# depends on the loader: it gets an asset that is ready, waits for one the loader is busy with, or loads a
+# missing one itself. pygame decodes and scales images and waits for events without holding the GIL, so the
+# main thread keeps running meanwhile. A failed load is only reported when the game asks for that asset.
+class AssetLoader:
+    def __init__(self):
+        self.queue = []
+        # Keeps requests of the same priority in the order they were made
+        self.order = 0
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target = self.work, name = 'asset loader', daemon = True)
+        self.thread.start()
+
+    # Queue function(*args) and return its AssetTask
+    def request(self, priority, function, *args):
+        task = AssetTask(function, args)
+        with self.condition:
+            heappush(self.queue, (priority, self.order, task))
+            self.order += 1
+            self.condition.notify()
+        return task
+
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                task = heappop(self.queue)[2]
+            task.run()
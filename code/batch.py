@@ -0,0 +1,85 @@
+import argparse
+import ast
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+# Batch runner for balance testing. Plays many seeded headless games with the bot on a pool of worker
+# processes, one Game per worker that is reset between runs, and streams one JSON line per finished game.
+#
+#   python batch.py --games 500 --out results.jsonl --set ENEMY_FAST_SPEED=400 --set SPAWN_INTERVAL_DECREASE=150
+#
+# --set overrides a constant from settings.py for the whole batch. A sweep is a series of batches with
+# different --set values; every result line records the overrides it was played with.
+# Nothing from the game is imported at the top of this module: the workers are started with 'spawn',
+# so each one imports the game fresh after its overrides have been applied to settings.
+
+_game = None
+_max_time = None
+
+# Worker start-up. Patch settings before anything does `from settings import *`, then build this worker's game.
+def init_worker(overrides, seek_home, max_time):
+    global _game, _max_time
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    import settings
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+    from main import Game
+    _game = Game(headless = True)
+    _game.controller.seek_home = seek_home
+    _max_time = max_time
+
+def play(seed):
+    _game.reset_game(seed)
+    _game.simulate(max_time = _max_time)
+    result = _game.result()
+    result['seed'] = seed
+    return result
+
+# NAME=VALUE, where VALUE is a Python literal and NAME must already exist in settings.py
+def parse_override(text):
+    name, _, value = text.partition('=')
+    import settings
+    if not name.isupper() or not hasattr(settings, name):
+        raise argparse.ArgumentTypeError(f'{name} is not a constant in settings.py')
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        raise argparse.ArgumentTypeError(f'{value!r} is not a valid value for {name}')
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Run many headless bot games in parallel and record the results.')
+    parser.add_argument('--games', type = int, default = 100, help = 'number of games to play')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed of the first game, the others count up from it')
+    parser.add_argument('--workers', type = int, default = os.cpu_count(), help = 'worker processes (default: all cores)')
+    parser.add_argument('--out', default = 'results.jsonl', help = "JSONL file to write, or '-' for stdout")
+    parser.add_argument('--set', dest = 'overrides', action = 'append', default = [], type = parse_override,
+                        metavar = 'NAME=VALUE', help = 'override a settings.py constant for this batch')
+    parser.add_argument('--survive', action = 'store_true', help = 'the bot stays put and fights instead of looking for the home')
+    parser.add_argument('--max-time', type = float, default = 600, help = 'game time limit per game in seconds')
+    args = parser.parse_args()
+
+    overrides = dict(args.overrides)
+    out = sys.stdout if args.out == '-' else open(args.out, 'a')
+    context = multiprocessing.get_context('spawn')
+    started = time.perf_counter()
+    try:
+        pool = context.Pool(args.workers, init_worker, (overrides, not args.survive, args.max_time * 1000))
+        for done, result in enumerate(pool.imap_unordered(play, range(args.seed, args.seed + args.games)), 1):
+            result['overrides'] = overrides
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+            print(f'\r{done}/{args.games} games', end = '', file = sys.stderr)
+        # Let the workers exit on their own. Terminating them while pygame is still initialised can hang.
+        pool.close()
+        pool.join()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f'\nfinished in {time.perf_counter() - started:.1f}s', file = sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import json
+import math
+import os
+
+# Asset pipeline step that builds the pre-scaled image atlases. Most images are drawn far smaller than they are
+# stored: the player frames at PLAYER_SCALE_FACTOR, the gun at GUN_SIZE from a 1920x1080 file, the bullet at
+# BULLET_SIZE, and so on. This scales every such image with the current settings, packs each group into one PNG
+# in images/atlas and writes index.json, which says where each image is. load_image then decodes a few small
+# atlases instead of every full size file, and keeps only the scaled pixels.
+#
+#   python build_atlas.py
+#
+# Run it again after changing a size or scale setting or an image. Until then, the images that changed are
+# simply read from their own files as before.
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+from settings import *
+from os.path import relpath
+from utils import get_asset_path
+from mapcache import atlas_layout, file_stat
+from assets import read_image, ATLAS_DIR, ATLAS_INDEX_PATH, ATLAS_VERSION
+
+# The frames in one folder (and its sub-folders) named by number, like images/player1/down/0.png
+def numbered_images(*path_parts):
+    paths = []
+    for folder_path, _, file_names in sorted(walk(get_asset_path(*path_parts))):
+        frame_files = [name for name in file_names if name.lower().endswith('.png') and name.split('.')[0].isdigit()]
+        for file_name in sorted(frame_files, key = lambda name: int(name.split('.')[0])):
+            paths.append(join(folder_path, file_name))
+    return paths
+
+# The images in each atlas, as (path, size, scale) exactly as the game passes them to load_image
+def atlas_contents():
+    heart_size = (int(HEART_ORIGINAL_WIDTH * HEART_SCALE_FACTOR), int(HEART_ORIGINAL_HEIGHT * HEART_SCALE_FACTOR))
+    return {
+        'player': [(path, None, PLAYER_SCALE_FACTOR) for path in numbered_images('images', 'player1')],
+        'enemies': [(path, None, None) for path in numbered_images('images', 'enemies')],
+        'gun': [
+            (get_asset_path('images', 'gun', 'lasergun.png'), (GUN_SIZE, GUN_SIZE), None),
+            (get_asset_path('images', 'gun', 'laser.png'), (BULLET_SIZE, BULLET_SIZE), None),
+        ],
+        'ui': [(get_asset_path('images', 'ui', f'hearts_{i}-removebg-preview.png'), heart_size, None) for i in range(1, 6)],
+        'home': [(get_asset_path('images', 'home', 'home.png'), HOME_SIZE, None)],
+    }
+
+# Pack the images into one surface, trying atlas widths from the widest image up to twice the square root of
+# their total area and keeping the one that leaves the least empty space. Each image is copied with
+# BLEND_RGBA_MAX onto the transparent atlas, which keeps its pixels exactly as they are (a normal blit would
+# blend the half transparent edges).
+def pack(surfs):
+    sizes = [surf.get_size() for surf in surfs]
+    widest = max(width for width, _ in sizes)
+    side = math.ceil(math.sqrt(sum(width * height for width, height in sizes)))
+    layouts = [atlas_layout(sizes, width) for width in range(widest, max(widest, side * 2) + 1)]
+    size, rects = min(layouts, key = lambda layout: layout[0][0] * layout[0][1])
+    atlas = pygame.Surface(size, pygame.SRCALPHA)
+    for surf, rect in zip(surfs, rects):
+        atlas.blit(surf, rect[:2], special_flags = pygame.BLEND_RGBA_MAX)
+    return atlas, rects
+
+def build_atlases():
+    os.makedirs(ATLAS_DIR, exist_ok = True)
+    root = get_asset_path()
+    atlases = []
+    for name, images in atlas_contents().items():
+        atlas, rects = pack([read_image(path, size, scale) for path, size, scale in images])
+        file_name = name + '.png'
+        pygame.image.save(atlas, os.path.join(ATLAS_DIR, file_name))
+        atlases.append({
+            'name': name,
+            'file': file_name,
+            'images': [
+                {'path': relpath(path, root).replace(os.sep, '/'), 'size': size, 'scale': scale, 'source': file_stat(path), 'rect': rect}
+                for (path, size, scale), rect in zip(images, rects)
+            ],
+        })
+        print(f'{file_name}: {len(images)} images, {atlas.get_width()}x{atlas.get_height()}')
+
+    # Written last, and through a temporary file, so the index never points at atlases that are not there yet
+    temp_path = ATLAS_INDEX_PATH + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump({'version': ATLAS_VERSION, 'atlases': atlases}, file)
+    os.replace(temp_path, ATLAS_INDEX_PATH)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Build the pre-scaled image atlases in images/atlas')
+    parser.parse_args()
+    pygame.init()
+    # Images are converted to the display format, so there has to be a display surface
+    pygame.display.set_mode((1, 1))
+    build_atlases()
+    pygame.quit()
+
+if __name__ == '__main__':
+    main()
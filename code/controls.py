@@ -0,0 +1,86 @@
+from settings import *
+from random import Random
+
+# Controllers turn some source of input into the three things the game asks for every frame:
+# which way the player walks, where the gun points, and whether the gun fires.
+# movement() and aim() return vectors that do not need to be normalized; aim() must not be zero.
+# reset() is called whenever a new game starts.
+
+# Real keyboard and mouse input, used when playing the game
+class KeyboardMouseController:
+    # Called when a new game starts
+    def reset(self):
+        pass
+
+    # Arrow keys or WASD
+    def movement(self):
+        keys = pygame.key.get_pressed()
+        return pygame.Vector2(
+            int(keys[pygame.K_RIGHT] or keys[pygame.K_d]) - int(keys[pygame.K_LEFT] or keys[pygame.K_a]),
+            int(keys[pygame.K_DOWN] or keys[pygame.K_s]) - int(keys[pygame.K_UP] or keys[pygame.K_w]),
+        )
+
+    # The camera keeps the player in the middle of the window, so aim from the window center to the mouse
+    def aim(self):
+        return pygame.Vector2(pygame.mouse.get_pos()) - pygame.Vector2(WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2)
+
+    # Left mouse button
+    def firing(self):
+        return pygame.mouse.get_pressed()[0]
+
+# Simple AI player for headless games. Walks toward the home, shoots at the nearest living enemy in range,
+# and when it stops making progress against an obstacle it side-steps for a moment.
+# With seek_home off it stays where it is and only fights, which is useful for measuring how long waves last.
+# Its own random choices come from its own rng, seeded with the game's seed, so a replay of a bot game (which
+# does not run the bot) still gets the same enemies from the game's rng.
+class BotController:
+    def __init__(self, game, seek_home = True):
+        self.game = game
+        self.seek_home = seek_home
+        self.rng = Random()
+        self.reset()
+
+    def reset(self):
+        self.rng.seed(self.game.seed)
+        self.last_pos = None
+        self.detour = None
+        self.detour_time = 0
+
+    def nearest_enemy(self):
+        player_pos = pygame.Vector2(self.game.player.rect.center)
+        nearest, nearest_distance = None, BOT_FIRE_RANGE
+        for enemy in self.game.enemy_sprites:
+            if enemy.death_time == 0:
+                distance = player_pos.distance_to(enemy.rect.center)
+                if distance < nearest_distance:
+                    nearest, nearest_distance = enemy, distance
+        return nearest
+
+    def movement(self):
+        home = self.game.home_sprite.sprite
+        if not home or not self.seek_home:
+            return pygame.Vector2()
+        player_pos = pygame.Vector2(self.game.player.rect.center)
+        direction = pygame.Vector2(home.rect.center) - player_pos
+
+        # Blocked since the last step: walk sideways for a while to get around the obstacle
+        if self.detour_time > 0:
+            self.detour_time -= 1
+            direction = self.detour
+        elif self.last_pos is not None and player_pos.distance_to(self.last_pos) < 1 and direction:
+            self.detour = direction.rotate(90 if self.rng.random() < 0.5 else -90)
+            self.detour_time = BOT_DETOUR_STEPS
+            direction = self.detour
+        self.last_pos = player_pos
+        return direction
+
+    def aim(self):
+        enemy = self.nearest_enemy()
+        if enemy:
+            direction = pygame.Vector2(enemy.rect.center) - self.game.player.rect.center
+            if direction:
+                return direction
+        return self.game.gun.player_direction
+
+    def firing(self):
+        return self.nearest_enemy() is not None
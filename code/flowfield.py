@@ -0,0 +1,114 @@
+from settings import *
+from heapq import heappush, heappop
+
+# Neighbouring cells as (column step, row step, cost). Straight steps cost 2 and diagonal steps 3, which is
+# close to the real 1 : 1.41 ratio while keeping the costs whole numbers.
+NEIGHBOURS = ((1, 0, 2), (-1, 0, 2), (0, 1, 2), (0, -1, 2), (1, 1, 3), (1, -1, 3), (-1, 1, 3), (-1, -1, 3))
+
+# Shared path toward the player for every enemy. The map is divided into TILE_SIZE cells, and a cell is blocked
+# when an obstacle (the Objects and Collisions layers) covers the middle of it. Whenever the player walks into
+# a new cell, one search from the player's cell finds, for every cell, the next cell on the shortest way to the
+# player. An enemy then only looks up the cell it stands in, so the cost of pathfinding does not depend on how
+# many enemies there are.
+#
+# next_cell holds that next cell (as column + row * columns) for every cell. It is -1 when the enemy should
+# head straight for the player: in the player's cell, next to it, or where no path exists.
+#
+# Which cells are blocked and which cells lead to which only depend on the map, so they are worked out once,
+# in a FlowGrid, and kept for every game on that map. A FlowField only holds the paths of one game.
+class FlowField:
+    def __init__(self, player, grid):
+        self.player = player
+        self.grid = grid
+        self.columns, self.rows = grid.columns, grid.rows
+        self.goal = None
+        self.next_cell = [-1] * (self.columns * self.rows)
+        self.version = 0
+
+    # The index of the cell that contains pos. Positions off the map use the nearest edge cell.
+    def cell_at(self, pos):
+        column = min(max(int(pos[0] // TILE_SIZE), 0), self.columns - 1)
+        row = min(max(int(pos[1] // TILE_SIZE), 0), self.rows - 1)
+        return column + row * self.columns
+
+    def cell_center(self, cell):
+        return (cell % self.columns * TILE_SIZE + TILE_SIZE // 2, cell // self.columns * TILE_SIZE + TILE_SIZE // 2)
+
+    # Search again if the player has moved to another cell since the last search
+    def refresh(self):
+        goal = self.cell_at(self.player.rect.center)
+        if goal != self.goal:
+            self.goal = goal
+            self.search(goal)
+
+    # Dijkstra from the player's cell outward. Every cell reached points back at the cell it was reached from,
+    # which is its next step toward the player.
+    def search(self, goal):
+        cell_count = self.columns * self.rows
+        distance = [None] * cell_count
+        next_cell = [-1] * cell_count
+        distance[goal] = 0
+        queue = [(0, goal)]
+        blocked, neighbours = self.grid.blocked, self.grid.neighbours
+        while queue:
+            cost, cell = heappop(queue)
+            if cost > distance[cell]:
+                continue
+            for neighbour, step_cost in neighbours[cell]:
+                new_cost = cost + step_cost
+                if distance[neighbour] is None or new_cost < distance[neighbour]:
+                    distance[neighbour] = new_cost
+                    next_cell[neighbour] = cell
+                    heappush(queue, (new_cost, neighbour))
+
+        # Enemies standing in a blocked cell (partly inside an obstacle) step to the best open cell beside it
+        for cell in range(cell_count):
+            if blocked[cell] and cell != goal:
+                reachable = [(distance[neighbour], neighbour) for neighbour, _ in neighbours[cell] if distance[neighbour] is not None]
+                if reachable:
+                    next_cell[cell] = min(reachable)[1]
+
+        # Next to the player, go straight for the player instead of the middle of its cell
+        for cell in range(cell_count):
+            if next_cell[cell] == goal:
+                next_cell[cell] = -1
+        self.next_cell = next_cell
+        self.version += 1
+
+    # The point an enemy at pos should walk toward
+    def target(self, pos):
+        self.refresh()
+        cell = self.next_cell[self.cell_at(pos)]
+        return self.player.rect.center if cell < 0 else self.cell_center(cell)
+
+# The cells of a map of size pixels, which of them obstacles block, and the open cells next to each one
+class FlowGrid:
+    def __init__(self, collision_grid, size):
+        self.columns = -(-size[0] // TILE_SIZE)
+        self.rows = -(-size[1] // TILE_SIZE)
+
+        # A cell is blocked if an obstacle overlaps the square of FLOW_FIELD_CLEARANCE pixels in its middle
+        self.blocked = []
+        for row in range(self.rows):
+            for column in range(self.columns):
+                middle = pygame.Rect(0, 0, FLOW_FIELD_CLEARANCE, FLOW_FIELD_CLEARANCE)
+                middle.center = (column * TILE_SIZE + TILE_SIZE // 2, row * TILE_SIZE + TILE_SIZE // 2)
+                self.blocked.append(bool(collision_grid.colliding(middle)))
+
+        # The open cells next to each cell. Diagonal steps are only allowed when both straight cells beside
+        # them are open, so paths do not cut the corners of obstacles.
+        self.neighbours = []
+        for row in range(self.rows):
+            for column in range(self.columns):
+                cells = []
+                for step_x, step_y, cost in NEIGHBOURS:
+                    x, y = column + step_x, row + step_y
+                    if not (0 <= x < self.columns and 0 <= y < self.rows) or self.is_blocked(x, y):
+                        continue
+                    if step_x and step_y and (self.is_blocked(column + step_x, row) or self.is_blocked(column, row + step_y)):
+                        continue
+                    cells.append((x + y * self.columns, cost))
+                self.neighbours.append(cells)
+
+    def is_blocked(self, column, row):
+        return self.blocked[column + row * self.columns]
@@ -1,18 +1,122 @@
-from settings import * 
+from settings import *
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from operator import attrgetter
+
+# Sort key used for the y-sorted drawing order
+centery = attrgetter('rect.centery')
 
 class AllSprites(pygame.sprite.Group):
     def __init__(self):
         super().__init__()
         self.display_surface = pygame.display.get_surface()
         self.offset = pygame.Vector2()
-    
-    def draw(self, target_pos):
+        # Pre-baked ground layer, set by Game.setup once the map is loaded
+        self.terrain = None
+        # Batched bullets (see projectiles.py), drawn on top of the sprites. Set by Game.setup.
+        self.projectiles = None
+
+        # Static sprites (trees, rocks, health packs, home) never move, so they are kept sorted by centery
+        # in two parallel lists and only looked up by range when drawing. Sprites are added to the group
+        # before their rect exists, so new static sprites wait in pending_static until the next draw.
+        self.static_keys = []
+        self.static_sprites = []
+        self.pending_static = []
+        self.static_half_height = 0
+
+        # Everything else (player, gun, enemies, bullets). A dict keeps insertion order for stable sorting.
+        self.moving_sprites = {}
+        # Top left of each moving sprite before the last game step, for drawing between steps (see draw)
+        self.previous = {}
+
+    def add_internal(self, sprite, layer = None):
+        super().add_internal(sprite, layer)
+        if getattr(sprite, 'static', False):
+            self.pending_static.append(sprite)
+        else:
+            self.moving_sprites[sprite] = None
+            # A sprite added during a step (a new or reused one) has no earlier position to move from
+            self.previous.pop(sprite, None)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        if sprite in self.moving_sprites:
+            del self.moving_sprites[sprite]
+        elif sprite in self.pending_static:
+            self.pending_static.remove(sprite)
+        else:
+            index = self.static_sprites.index(sprite)
+            del self.static_sprites[index]
+            del self.static_keys[index]
+
+    # Static sprites have nothing to update, and sprites with scheduled = True (enemies) are updated by their
+    # own scheduler, so only the rest are updated here
+    def update(self, *args):
+        for sprite in list(self.moving_sprites):
+            if not getattr(sprite, 'scheduled', False):
+                sprite.update(*args)
+
+    # Called before each game step, so draw can place moving sprites between where they were and where they are
+    def remember_positions(self):
+        self.previous = {sprite: sprite.rect.topleft for sprite in self.moving_sprites}
+        if self.projectiles:
+            self.projectiles.remember_positions()
+
+    # The top left a moving sprite is drawn at, alpha of the way from its position before the last step to its current one
+    def interpolate(self, sprite, alpha):
+        x, y = sprite.rect.topleft
+        previous = self.previous.get(sprite)
+        if previous is None:
+            return x, y
+        return previous[0] + (x - previous[0]) * alpha, previous[1] + (y - previous[1]) * alpha
+
+    def interpolated_center(self, sprite, alpha):
+        x, y = self.interpolate(sprite, alpha)
+        return x + sprite.rect.width / 2, y + sprite.rect.height / 2
+
+    # Move the static sprites added since the last draw into the sorted lists
+    def insert_pending_static(self):
+        for sprite in self.pending_static:
+            index = bisect_right(self.static_keys, sprite.rect.centery)
+            self.static_keys.insert(index, sprite.rect.centery)
+            self.static_sprites.insert(index, sprite)
+            self.static_half_height = max(self.static_half_height, sprite.rect.height // 2 + 1)
+        self.pending_static.clear()
+
+    # Return the static sprites touching view_rect, already in draw order. The centery range is widened
+    # by half of the tallest static sprite so sprites that only reach into the view are still found.
+    def visible_static(self, view_rect):
+        start = bisect_left(self.static_keys, view_rect.top - self.static_half_height)
+        end = bisect_right(self.static_keys, view_rect.bottom + self.static_half_height)
+        return [sprite for sprite in self.static_sprites[start:end] if view_rect.colliderect(sprite.rect)]
+
+    # alpha (0 to 1) is how far real time has got from the last game step to the next one. Moving sprites are drawn
+    # that far between their last two positions, so motion looks smooth when frames and steps do not line up.
+    def draw(self, target_pos, alpha = 1):
         self.offset.x = -(target_pos[0] - WINDOW_WIDTH / 2)
         self.offset.y = -(target_pos[1] - WINDOW_HEIGHT / 2)
 
-        ground_sprites = [sprite for sprite in self if hasattr(sprite, 'ground')] 
-        object_sprites = [sprite for sprite in self if not hasattr(sprite, 'ground')] 
-        
-        for layer in [ground_sprites, object_sprites]:
-            for sprite in sorted(layer, key = lambda sprite: sprite.rect.centery):
+        # The ground is drawn first so every sprite appears on top of it
+        if self.terrain:
+            self.terrain.draw(self.display_surface, self.offset)
+
+        if self.pending_static:
+            self.insert_pending_static()
+
+        # Only sprites inside the window (plus a margin) are drawn
+        view_rect = pygame.Rect(-self.offset.x, -self.offset.y, WINDOW_WIDTH, WINDOW_HEIGHT).inflate(DRAW_MARGIN * 2, DRAW_MARGIN * 2)
+        static_sprites = self.visible_static(view_rect)
+        moving_sprites = sorted((sprite for sprite in self.moving_sprites if view_rect.colliderect(sprite.rect)), key = centery)
+
+        # Merge the few moving sprites into the already sorted static order
+        offset_x, offset_y = self.offset
+        previous = self.previous if alpha < 1 else {}
+        for sprite in merge(static_sprites, moving_sprites, key = centery):
+            if sprite in previous:
+                x, y = self.interpolate(sprite, alpha)
+                self.display_surface.blit(sprite.image, (x + offset_x, y + offset_y))
+            else:
                 self.display_surface.blit(sprite.image, sprite.rect.topleft + self.offset)
+
+        if self.projectiles:
+            self.projectiles.draw(self.display_surface, self.offset, alpha)
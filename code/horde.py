@@ -0,0 +1,171 @@
+from settings import *
+from time import perf_counter
+
+# numpy is optional. Without it (or with BATCHED_ENEMIES off) every Enemy moves itself as before.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ENGINE_AVAILABLE = numpy is not None
+
+# Moves living enemies in one batch. Hitbox positions, sizes and speeds live in numpy arrays indexed by
+# slot, the chase direction toward the player is computed for all of them at once, and obstacle collisions are
+# resolved against arrays of the obstacle rects. The Enemy sprites only animate and get their rects copied
+# back once per frame, so they stay usable for drawing and for the bullet and player collision checks.
+#
+# Positions are rounded the way pygame rounds a float assigned to a Rect and obstacles are handled in the same
+# order as handle_collision, so enemies end up exactly where the per-sprite code would put them.
+class EnemyEngine:
+    def __init__(self, player, obstacles, flow_field = None):
+        self.player = player
+        self.flow_field = flow_field
+        self.flow_version = None
+        rects = [sprite.rect for sprite in obstacles]
+        self.obstacle_left = numpy.array([rect.left for rect in rects], dtype = float)
+        self.obstacle_top = numpy.array([rect.top for rect in rects], dtype = float)
+        self.obstacle_right = numpy.array([rect.right for rect in rects], dtype = float)
+        self.obstacle_bottom = numpy.array([rect.bottom for rect in rects], dtype = float)
+
+        self.sprites = []
+        capacity = ENEMY_ENGINE_CAPACITY
+        self.x = numpy.zeros(capacity)
+        self.y = numpy.zeros(capacity)
+        self.width = numpy.zeros(capacity)
+        self.height = numpy.zeros(capacity)
+        self.speed = numpy.zeros(capacity)
+        self.moving = numpy.zeros(capacity, dtype = bool)
+        # Seconds each enemy moves by in the next update, 0 for enemies that wait (see move)
+        self.step = numpy.zeros(capacity)
+        # Seconds the last update took per enemy it moved, which the scheduler's budget counts on (see lod.py)
+        self.cost = 0
+
+    def grow(self):
+        for name in ('x', 'y', 'width', 'height', 'speed', 'moving', 'step'):
+            array = getattr(self, name)
+            setattr(self, name, numpy.concatenate([array, numpy.zeros_like(array)]))
+
+    # Give an enemy a slot. Its position is taken from its hitbox.
+    def add(self, enemy):
+        if len(self.sprites) == len(self.x):
+            self.grow()
+        slot = len(self.sprites)
+        enemy.slot = slot
+        self.sprites.append(enemy)
+        hitbox = enemy.hitbox_rect
+        self.x[slot], self.y[slot] = hitbox.x, hitbox.y
+        self.width[slot], self.height[slot] = hitbox.width, hitbox.height
+        self.speed[slot] = enemy.speed
+        self.moving[slot] = True
+        self.step[slot] = 0
+
+    # Move an enemy by dt seconds in the next update. The EnemyScheduler (lod.py) decides which enemies move
+    # and by how much, as it does for enemies that move themselves, so both play out the same.
+    def move(self, enemy, dt):
+        self.step[enemy.slot] = dt
+
+    # Take an enemy's position from its hitbox again, after it was moved from outside the engine
+    def place(self, enemy):
+        self.x[enemy.slot], self.y[enemy.slot] = enemy.hitbox_rect.x, enemy.hitbox_rect.y
+
+    # A dead enemy stays where it is until its death animation ends
+    def stop(self, enemy):
+        self.moving[enemy.slot] = False
+
+    # Free an enemy's slot by moving the last enemy into it
+    def remove(self, enemy):
+        slot, last = enemy.slot, len(self.sprites) - 1
+        moved = self.sprites[last]
+        self.sprites[slot] = moved
+        moved.slot = slot
+        for array in (self.x, self.y, self.width, self.height, self.speed, self.moving, self.step):
+            array[slot] = array[last]
+        self.sprites.pop()
+
+    def clear(self):
+        self.sprites = []
+
+    # Unit vectors from each enemy's center to the player's center, zero for enemies right on the player.
+    # With a flow field, enemies head for the next cell on their way around obstacles instead, as in Enemy.move.
+    def chase_directions(self, x, y, width, height):
+        center_x, center_y = x + width // 2, y + height // 2
+        target_x, target_y = self.player.rect.center
+        if self.flow_field:
+            target_x, target_y = self.flow_targets(center_x, center_y, target_x, target_y)
+        dx = target_x - center_x
+        dy = target_y - center_y
+        length = numpy.hypot(dx, dy)
+        length[length == 0] = numpy.inf
+        return dx / length, dy / length
+
+    # FlowField.target for every enemy at once
+    def flow_targets(self, center_x, center_y, player_x, player_y):
+        field = self.flow_field
+        field.refresh()
+        if field.version != self.flow_version:
+            self.flow_version = field.version
+            self.next_cell = numpy.array(field.next_cell)
+        column = numpy.clip(center_x // TILE_SIZE, 0, field.columns - 1).astype(int)
+        row = numpy.clip(center_y // TILE_SIZE, 0, field.rows - 1).astype(int)
+        next_cell = self.next_cell[column + row * field.columns]
+        straight = next_cell < 0
+        target_x = numpy.where(straight, player_x, next_cell % field.columns * TILE_SIZE + TILE_SIZE // 2)
+        target_y = numpy.where(straight, player_y, next_cell // field.columns * TILE_SIZE + TILE_SIZE // 2)
+        return target_x, target_y
+
+    # Push hitboxes that overlap an obstacle back out along the axis they moved on. Like handle_collision, every
+    # enemy checks the obstacles in order and after a push carries on from the next one, so the result is the
+    # same as moving the enemies one by one. Each pass handles one push for every enemy that still overlaps.
+    # Hitboxes of the smaller enemy images have a negative height; pygame treats those as spanning y + height to y.
+    def resolve(self, x, y, width, height, direction, horizontal):
+        obstacle_index = numpy.arange(len(self.obstacle_left))
+        start = numpy.zeros(len(x), dtype = int)
+        active = numpy.flatnonzero(direction != 0)
+        while len(active):
+            left, right = numpy.minimum(x[active], x[active] + width[active]), numpy.maximum(x[active], x[active] + width[active])
+            top, bottom = numpy.minimum(y[active], y[active] + height[active]), numpy.maximum(y[active], y[active] + height[active])
+            overlap = ((left[:, None] < self.obstacle_right) & (right[:, None] > self.obstacle_left)
+                       & (top[:, None] < self.obstacle_bottom) & (bottom[:, None] > self.obstacle_top)
+                       & (obstacle_index >= start[active, None]))
+            hit = overlap.any(axis = 1)
+            active, first = active[hit], overlap[hit].argmax(axis = 1)
+            forward = direction[active] > 0
+            if horizontal:
+                x[active] = numpy.where(forward, self.obstacle_left[first] - width[active], self.obstacle_right[first])
+            else:
+                y[active] = numpy.where(forward, self.obstacle_top[first] - height[active], self.obstacle_bottom[first])
+            start[active] = first + 1
+
+    # Move the enemies that were given a step since the last update
+    def update(self):
+        count = len(self.sprites)
+        if not count:
+            return
+        start = perf_counter()
+        moving = numpy.flatnonzero(self.moving[:count] & (self.step[:count] > 0))
+        dt = self.step[moving]
+        self.step[:count] = 0
+        x, y = self.x[moving], self.y[moving]
+        width, height, speed = self.width[moving], self.height[moving], self.speed[moving]
+
+        direction_x, direction_y = self.chase_directions(x, y, width, height)
+        x = round_like_rect(x + direction_x * speed * dt)
+        self.resolve(x, y, width, height, direction_x, True)
+        y = round_like_rect(y + direction_y * speed * dt)
+        self.resolve(x, y, width, height, direction_y, False)
+        self.x[moving], self.y[moving] = x, y
+
+        # Copy the new positions back to the sprites
+        sprites = self.sprites
+        for slot, left, top, dir_x, dir_y in zip(moving.tolist(), x.tolist(), y.tolist(), direction_x.tolist(), direction_y.tolist()):
+            enemy = sprites[slot]
+            hitbox = enemy.hitbox_rect
+            hitbox.topleft = (left, top)
+            enemy.rect.center = hitbox.center
+            enemy.direction.update(dir_x, dir_y)
+        if len(moving):
+            self.cost = (perf_counter() - start) / len(moving)
+
+# pygame rounds floats assigned to a Rect to the nearest integer, with halves rounded away from zero
+def round_like_rect(values):
+    return numpy.copysign(numpy.floor(numpy.abs(values) + 0.5), values)
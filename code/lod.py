@@ -0,0 +1,61 @@
+from settings import *
+from time import perf_counter
+
+# Level of detail for enemy updates. Enemies are not updated by AllSprites (they have scheduled = True) but
+# by this scheduler, once per frame after the other sprites:
+#
+# - Enemies in the window, or within ENEMY_LOD_MARGIN pixels of it, get a full update every frame.
+# - The others are updated at most every ENEMY_LOD_INTERVAL milliseconds, with all the time since their last
+#   update as one step (at most ENEMY_LOD_MAX_STEP seconds, so they cannot skip through obstacles), and
+#   without animating. They take turns: each frame starts where the previous one stopped, and stops once
+#   budget milliseconds have been spent on them. The rest wait for the next frame, so the cost of far
+#   enemies stays the same however many there are.
+#
+# Enemies moved by an EnemyEngine are treated the same: the scheduler hands each one its step, and the engine
+# then moves the ones that got one, together. So games play out the same with or without numpy. Handing out a
+# step costs next to nothing, so the budget also counts the time the engine will take to move each far enemy,
+# at what it took per enemy in its last update.
+#
+# The budget depends on how fast the machine is, so headless games run without one to stay repeatable.
+class EnemyScheduler:
+    def __init__(self, enemies, player, budget = None, engine = None):
+        self.enemies = enemies
+        self.player = player
+        self.engine = engine
+        self.budget = budget / 1000 if budget is not None else None
+        self.interval = ENEMY_LOD_INTERVAL / 1000
+        self.view = pygame.Rect(0, 0, WINDOW_WIDTH + ENEMY_LOD_MARGIN * 2, WINDOW_HEIGHT + ENEMY_LOD_MARGIN * 2)
+        self.turn = 0
+
+    def update(self, dt):
+        self.view.center = self.player.rect.center
+        far = []
+        for enemy in self.enemies.sprites():
+            enemy.lod_time += dt
+            if not ENEMY_LOD or self.view.colliderect(enemy.rect):
+                # An enemy coming back into view catches up on the time it waited, in one limited step
+                enemy.update(max(dt, min(enemy.lod_time, ENEMY_LOD_MAX_STEP)))
+                enemy.lod_time = 0
+            else:
+                far.append(enemy)
+        if far:
+            self.update_far(far)
+
+    # Update the far enemies that are due, taking turns from where the last frame stopped
+    def update_far(self, far):
+        start = self.turn % len(far)
+        deadline = perf_counter() + self.budget if self.budget is not None else None
+        # Time the engine will spend later this frame on the far enemies given a step so far
+        cost = self.engine.cost if self.engine else 0
+        moving = 0
+        for index in range(len(far)):
+            enemy = far[(start + index) % len(far)]
+            if enemy.lod_time < self.interval:
+                continue
+            if deadline is not None and perf_counter() + moving > deadline:
+                self.turn = start + index
+                return
+            enemy.update_far(min(enemy.lod_time, ENEMY_LOD_MAX_STEP))
+            enemy.lod_time = 0
+            moving += cost
+        self.turn = start + len(far)
@@ -1,27 +1,90 @@
 from settings import *
 from player import Player
-from sprites import GroundSprite, CollisionSprite, Gun, Bullet, Enemy, Home, HealthPack
-from pytmx.util_pygame import load_pygame
-from random import randint, choice
+from sprites import CollisionSprite, Gun, Bullet, Enemy, Home, HealthPack
+from random import Random, getrandbits
 from groups import AllSprites
+from terrain import Terrain
+from spatial import SpatialGrid
 from utils import get_asset_path 
-from screens import StartScreen, WinScreen, GameOverScreen, ScreenAction
-
-
-
+from assets import load_image, load_mask, load_map, load_font, AssetLoader, AssetTask, GAME_SETUP, LATER
+from screens import StartScreen, WinScreen, GameOverScreen, ScreenAction, preload_screen_images
+from controls import KeyboardMouseController, BotController
+from timing import SimulationClock, use_clock, get_ticks, schedule
+from profiler import FrameProfiler
+from horde import EnemyEngine, ENGINE_AVAILABLE
+from flowfield import FlowField, FlowGrid
+from pool import SpritePool
+from projectiles import Projectiles
+from lod import EnemyScheduler
+from replay import RecordingController, ReplayController, load_replay
+from snapshot import write_snapshot, read_snapshot
+
+
+
+import argparse
 import os
 
 class Game:
-    def __init__(self):
+    # A headless game has no visible window and nothing is drawn. It runs its fixed time steps back to back
+    # (see simulate), and is played by the given controller, or by a BotController by default.
+    # seed makes the random choices (enemy types, spawn points, home position) repeatable.
+    # profile_path is a .csv or .json file that per-frame timings are written to when the game exits.
+    # frame_cap limits how many frames per second a windowed game draws (0 for no limit).
+    # With record_path, the seed and input of every game are saved there as a replay (see replay.py) when it ends.
+    # With replay (a Replay), the recorded game is played again, with its seed and input, and ends where it did.
+    # With checkpoint_path, a snapshot of the game (see snapshot.py) is saved there every CHECKPOINT_INTERVAL of game time.
+    def __init__(self, headless = False, controller = None, seed = None, profile_path = None, frame_cap = FRAME_CAP,
+                 record_path = None, replay = None, checkpoint_path = None):
         #Initializes the library, creates the game window, and sets the game loop flag to true
+        # Headless games use SDL's dummy video driver. Images still need a display surface to convert to.
+        self.headless = headless
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
         pygame.init()
         self.display_surface = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
         pygame.display.set_caption('Help Susie Get Home')
         self.clock = pygame.time.Clock()
+        self.frame_cap = frame_cap
         self.running = True
 
-        # UI font
-        self.wave_text_font = pygame.font.Font(None, 40)
+        # Time source for every timer in the game. It only moves when the game steps (see step), so timers
+        # give the same results however fast or slow frames are drawn.
+        self.sim_clock = SimulationClock()
+        use_clock(self.sim_clock)
+
+        # Every game has a seed, a random one when none is given, so that any game can be recorded and replayed
+        if replay is not None:
+            if replay.dt != FIXED_DT:
+                raise ValueError('the replay was recorded with a different FIXED_DT')
+            seed = replay.seed
+        self.seed = check_seed(seed) if seed is not None else getrandbits(64)
+        self.rng = Random(self.seed)
+
+        # Game steps so far, and where this game's input comes from (and goes to, when recording)
+        self.steps = 0
+        self.replay = replay
+        self.record_path = record_path
+        self.games_recorded = 0
+        self.recorder = None
+        if replay is not None:
+            controller = ReplayController(replay)
+        elif controller is None:
+            controller = BotController(self) if headless else KeyboardMouseController()
+        if record_path and replay is None:
+            controller = self.recorder = RecordingController(controller, self.seed)
+        self.controller = controller
+
+        # Where to save checkpoints, and the game time of the next one
+        self.checkpoint_path = checkpoint_path
+        self.next_checkpoint = CHECKPOINT_INTERVAL
+
+        # Per-phase frame timings, shown with F3
+        self.profiler = FrameProfiler(profile_path)
+
+        # UI font, and the rendered wave label with the wave number it shows
+        self.wave_text_font = load_font(40)
+        self.wave_label = None
+        self.wave_label_number = None
         
         # Adds sprite objects into groups, which are pygame containers
         self.all_sprites = AllSprites()
@@ -45,20 +108,52 @@ class Game:
         # game state
         self.game_won = False
 
+        # Statistics for headless runs (see result)
+        self.total_kills = 0
+        self.damage_taken = 0
+        self.death_cause = None
+
         # Spawn enemy ever 2 seconds. Use the spawn_positions list to store enemy spawn positions. 
-        self.enemy_event = pygame.event.custom_type()
-        pygame.time.set_timer(self.enemy_event, INITIAL_SPAWN_INTERVAL)
+        # The spawn timer runs on the game clock, so it also works on the simulated clock.
+        self.spawn_timer = None
+        self.set_spawn_interval(INITIAL_SPAWN_INTERVAL)
         self.spawn_positions = []
 
-        # Load in all images and sprites and set up the game.
+        # Kinds of enemies (one folder of frames each), and the frames, masks and death silhouette of the kinds
+        # loaded so far (see enemy_kind). The folders are sorted, because the order os.walk lists them in
+        # depends on the file system, and the rng picks kinds from this list by position.
+        self.enemy_folders = sorted(next(walk(get_asset_path('images', 'enemies')))[1])
+        self.enemy_kinds = {}
+
+        # Blocked cells and neighbours of the map for pathfinding (see flowfield.py), made by the first setup
+        self.flow_grid = None
+        # Blank surfaces of the invisible border rectangles, made by the first setup and reused by later ones
+        self.border_surfs = None
+
+        # Load in all images and sprites and set up the game. A windowed game does this on a background thread,
+        # so the start screen shows and responds at once: first the game itself, then the enemy kinds that have
+        # not spawned yet, then the win and game over art. run() only waits for the game if it is still loading
+        # when PLAY is clicked. A headless game loads everything here.
+        if headless:
+            self.loading = AssetTask(self.load, ())
+            self.loading.result()
+        else:
+            self.loader = AssetLoader()
+            self.loading = self.loader.request(GAME_SETUP, self.load)
+            for folder in self.enemy_folders:
+                self.loader.request(LATER, self.load_enemy_frames, folder)
+            preload_screen_images(self.loader)
+
+    def load(self):
         self.load_images()
         self.setup()
 
     # Function that loads all images. Sets the bullet image to a scaled size. 
+    # Images come from the shared asset cache, so each file is only decoded and scaled once.
     def load_images(self):
-        bullet_original = pygame.image.load(get_asset_path('images', 'gun', 'laser.png')).convert_alpha()
         bullet_size = BULLET_SIZE
-        self.bullet_surf = pygame.transform.scale(bullet_original, (bullet_size, bullet_size))
+        self.bullet_surf = load_image(get_asset_path('images', 'gun', 'laser.png'), (bullet_size, bullet_size))
+        self.bullet_mask = pygame.mask.from_surface(self.bullet_surf)
 
     # Stores the heart images in a dictionary with keys being the number of hearts (0 to 5 hearts)
     # in the image (to reflect health level)
@@ -66,57 +161,81 @@ class Game:
         scale_factor = HEART_SCALE_FACTOR
         for i in range(1, 6): 
             heart_path = get_asset_path('images', 'ui', f'hearts_{i}-removebg-preview.png')
-            heart_surf = pygame.image.load(heart_path).convert_alpha()
             new_width = int(HEART_ORIGINAL_WIDTH * scale_factor)
             new_height = int(HEART_ORIGINAL_HEIGHT * scale_factor)
 
             # Scale down each heart image
-            self.heart_images[i] = pygame.transform.scale(heart_surf, (new_width, new_height))
-
-        # Load enemy frames for each enemy type by looping through the folder storing each enemy type
-        # and initializing an empty list fo rall frames of a specific type of enemy
-        enemies_path = get_asset_path('images', 'enemies') 
-        folders = list(walk(enemies_path))[0][1]
-        self.enemy_frames = {}
-        for folder in folders:
-            folder_full_path = os.path.join(enemies_path, folder)
-            for folder_path, _, file_names in walk(folder_full_path):
-                self.enemy_frames[folder] = []
-                for file_name in sorted(file_names, key=lambda name: int(name.split('.')[0])):
-                    full_path = join(folder_path, file_name)
-                    surf = pygame.image.load(full_path).convert_alpha()
-                    self.enemy_frames[folder].append(surf)
-    # Handle player shooting input. If the left mouse is pressed and shooting is allowed, then 
+            self.heart_images[i] = load_image(heart_path, (new_width, new_height))
+
+    # Load the frames of one kind of enemy, in order, with a collision mask for every frame
+    def load_enemy_frames(self, folder):
+        folder_path = get_asset_path('images', 'enemies', folder)
+        file_names = next(walk(folder_path))[2]
+        frames, masks = [], []
+        for file_name in sorted(file_names, key=lambda name: int(name.split('.')[0])):
+            full_path = join(folder_path, file_name)
+            frames.append(load_image(full_path))
+            masks.append(load_mask(full_path))
+        return frames, masks
+
+    # The frames, masks and death silhouette (the white shape shown when an enemy of that kind dies) of one kind
+    # of enemy. A kind is only loaded when the first enemy of it is made, and kept for every later game.
+    def enemy_kind(self, folder):
+        if folder not in self.enemy_kinds:
+            frames, masks = self.load_enemy_frames(folder)
+            death_surf = masks[0].to_surface()
+            death_surf.set_colorkey('black')
+            self.enemy_kinds[folder] = (frames, masks, death_surf)
+        return self.enemy_kinds[folder]
+    # Handle player shooting input. If the left mouse is pressed (or the controller fires) and shooting is allowed, then 
     # calculate the spawn position of bullet as 50 pixels in front of the laser shooter, in the 
-    # direction of the player. Then create a bullet sprite with this information. 
+    # direction of the player. Then create a bullet with this information. 
+    # With BULLETS_PER_SHOT above 1, the bullets fan out BULLET_SPREAD degrees apart around that direction.
     # Disable shooting ability until the cooldown is over
     def input(self):
-        if pygame.mouse.get_pressed()[0] and self.can_shoot:
+        if self.controller.firing() and self.can_shoot:
             pos = self.gun.rect.center + self.gun.player_direction * BULLET_OFFSET
-            Bullet(self.bullet_surf, pos, self.gun.player_direction, (self.all_sprites, self.bullet_sprites))
-            self.can_shoot = False
-            self.shoot_time = pygame.time.get_ticks()
+            for shot in range(BULLETS_PER_SHOT):
+                direction = self.gun.player_direction
+                if BULLETS_PER_SHOT > 1:
+                    direction = direction.rotate((shot - (BULLETS_PER_SHOT - 1) / 2) * BULLET_SPREAD)
+                self.fire_bullet(pos, direction)
+            self.start_gun_cooldown(get_ticks())
+
+    # Add a bullet to the batch, or reuse a pooled bullet sprite when bullets are not batched
+    def fire_bullet(self, pos, direction):
+        if self.projectiles:
+            self.projectiles.fire(pos, direction)
+            return
+        bullet = self.bullet_pool.take()
+        if bullet:
+            bullet.activate(pos, direction, (self.all_sprites, self.bullet_sprites))
+        else:
+            Bullet(self.bullet_surf, self.bullet_mask, pos, direction, (self.all_sprites, self.bullet_sprites), self.bullet_pool)
 
-    # Manage shooting cooldown using a timer
-    def gun_timer(self):
-        if not self.can_shoot:
-            current_time = pygame.time.get_ticks()
-            if current_time - self.shoot_time >= self.gun_cooldown:
-                self.can_shoot = True 
+    # Manage shooting cooldown using a timer: no shooting for the gun cooldown from shoot_time on
+    def start_gun_cooldown(self, shoot_time):
+        self.can_shoot = False
+        self.shoot_time = shoot_time
+        schedule(shoot_time + self.gun_cooldown, self.reload)
+
+    def reload(self):
+        self.can_shoot = True
 
         
     # Sets up the game by loading the map.  Then for each layer in the map, loop through each object
     # in that layer, and create a sprite for each object.
     def setup(self):
+        # The parsed map and the baked ground are kept across games, so play again only rebuilds the sprites
         tmx_path = get_asset_path("data", "maps", "world.tmx")
-        map = load_pygame(tmx_path)
+        map = load_map(tmx_path)
         
         # Store the possible home spawning positions
         home_spawn_positions = []
         
-        # Creating sprites for each ground tile.
-        for x, y, image in map.get_layer_by_name('Ground').tiles():
-            GroundSprite((x * TILE_SIZE,y * TILE_SIZE), image, self.all_sprites)
+        # Bake the ground tiles into chunks once. They never move, so they don't need to be sprites.
+        if not self.all_sprites.terrain:
+            self.all_sprites.terrain = Terrain(map.get_layer_by_name('Ground').tiles())
         
         # Creating the visible object sprites, such as the trees and rocks. 
         for obj in map.get_layer_by_name('Objects'):
@@ -124,8 +243,15 @@ class Game:
 
         # Contains all the invisible rectangles on the border of the map to prevent player from going off the map
         # thus this is only added to the collision_sprites, not to all_sprites (otherwise it would not be invisible)
-        for obj in map.get_layer_by_name('Collisions'):
-            CollisionSprite((obj.x, obj.y), pygame.Surface((obj.width, obj.height)), self.collision_sprites)
+        # Their surfaces are never drawn, so they are made once for the map and shared by every game after it.
+        borders = map.get_layer_by_name('Collisions')
+        if self.border_surfs is None:
+            self.border_surfs = [pygame.Surface((obj.width, obj.height)) for obj in borders]
+        for obj, surf in zip(borders, self.border_surfs):
+            CollisionSprite((obj.x, obj.y), surf, self.collision_sprites)
+
+        # Index every obstacle by TILE_SIZE cells once, so player and enemy movement only checks nearby obstacles
+        self.collision_grid = SpatialGrid(self.collision_sprites)
 
         # Load health packs from the Health layer
         for obj in map.get_layer_by_name('Health'):
@@ -138,7 +264,7 @@ class Game:
         # of enemy spawn locations. 
         for obj in map.get_layer_by_name('Entities'):
             if obj.name == 'Player':
-                self.player = Player((obj.x,obj.y), self.all_sprites, self.collision_sprites)
+                self.player = Player((obj.x,obj.y), self.all_sprites, self.collision_grid, self.controller)
                 self.gun = Gun(self.player, self.all_sprites)
             elif obj.name == 'Home':  
                 home_spawn_positions.append((obj.x, obj.y))
@@ -146,39 +272,127 @@ class Game:
                 self.spawn_positions.append((obj.x, obj.y))
         # Randomly chooses one home spawn position and render the home image there
         if home_spawn_positions:
-            home_pos = choice(home_spawn_positions)
+            home_pos = self.rng.choice(home_spawn_positions)
             Home(home_pos, (self.all_sprites, self.home_sprite))
+
+        # One path toward the player that every enemy follows around the obstacles. The cells it is found on
+        # only depend on the map, so like the terrain they are worked out once and kept for later games.
+        if ENEMY_PATHFINDING and not self.flow_grid:
+            self.flow_grid = FlowGrid(self.collision_grid, self.all_sprites.terrain.size)
+        self.flow_field = FlowField(self.player, self.flow_grid) if ENEMY_PATHFINDING else None
+
+        # Enemies chase the player as one numpy batch when possible, otherwise each one moves itself
+        self.enemy_engine = EnemyEngine(self.player, self.collision_sprites, self.flow_field) if BATCHED_ENEMIES and ENGINE_AVAILABLE else None
+
+        # Enemies far from the window are updated less often, within a time budget when playing. How far the budget
+        # gets depends on the machine, so recorded and replayed games go without one, like headless games.
+        repeatable = self.headless or self.recorder or self.replay
+        self.enemy_scheduler = EnemyScheduler(self.enemy_sprites, self.player, None if repeatable else ENEMY_LOD_BUDGET,
+            self.enemy_engine)
+
+        # Bullets live in one set of arrays when numpy is there
+        self.projectiles = Projectiles(self.bullet_surf, self.bullet_mask, self.collision_sprites) if BATCHED_BULLETS and ENGINE_AVAILABLE else None
+        self.all_sprites.projectiles = self.projectiles
+
+        # Finished bullets and enemies are kept and reused (see pool.py). The pools start with as many bullets
+        # as can be in flight at once, and as many enemies as wave ENEMY_POOL_WAVES + 1 has.
+        self.bullet_pool = SpritePool()
+        if not self.projectiles:
+            self.bullet_pool.fill((BULLET_LIFETIME // GUN_COOLDOWN + 1) * BULLETS_PER_SHOT,
+                lambda: Bullet(self.bullet_surf, self.bullet_mask, (0, 0), pygame.Vector2(), (), self.bullet_pool))
+        self.enemy_pool = SpritePool()
+        frames, masks, death_surf = self.enemy_kind(self.enemy_folders[0])
+        self.enemy_pool.fill(INITIAL_ENEMIES_PER_WAVE + ENEMY_POOL_WAVES * ENEMIES_INCREMENT_PER_WAVE,
+            lambda: Enemy((0, 0), frames, masks, death_surf, (),
+                self.player, self.collision_grid, 'normal', self.enemy_engine, self.flow_field, self.enemy_pool))
     
     # Checks if bullets and enemies are colliding. If so, call the destory method on the enemy sprite 
     # that was hit, and remove the bullet from the game.
     # Also, if the bullet collides with a tree, rock, or any other static sprite, it is also killed 
     # this is to simulate the tree, rock, etc blocking the bullet's path.
+    # Enemies are put into a grid once per frame so each bullet only runs the mask test against the
+    # enemies whose rect it overlaps, and obstacles are looked up through the static collision grid.
+    # Batched bullets find their hits and obstacles themselves and remove the bullets that were used up.
     def bullet_collision(self):
-        if self.bullet_sprites:
+        if self.projectiles:
+            for collision_sprites in self.projectiles.collide(self.enemy_sprites):
+                self.enemy_hit(collision_sprites)
+        elif self.bullet_sprites:
+            enemy_grid = SpatialGrid(self.enemy_sprites, ENEMY_GRID_CELL_SIZE)
             for bullet in self.bullet_sprites:
-                collision_sprites = pygame.sprite.spritecollide(bullet, self.enemy_sprites, False, pygame.sprite.collide_mask)
+                collision_sprites = [sprite for sprite in enemy_grid.colliding(bullet.rect) if pygame.sprite.collide_mask(bullet, sprite)]
                 if collision_sprites:
-                    for sprite in collision_sprites:
-                        sprite.destroy()
-                        if sprite.death_time > 0:  # Enemy actually died
-                            self.enemies_killed += 1
-                            self.check_wave_complete()
+                    self.enemy_hit(collision_sprites)
                     bullet.kill()
                 # Check collision with obstacles (trees, rocks, borders)
-                elif pygame.sprite.spritecollide(bullet, self.collision_sprites, False):
+                elif self.collision_grid.colliding(bullet.rect):
                     bullet.kill()
+
+    # Damage the enemies one bullet hit, and count the ones that died
+    def enemy_hit(self, collision_sprites):
+        for sprite in collision_sprites:
+            sprite.destroy()
+            if sprite.death_time > 0:  # Enemy actually died
+                self.enemies_killed += 1
+                self.total_kills += 1
+                self.check_wave_complete()
+
     def check_wave_complete(self):
         if self.enemies_killed >= self.enemies_per_wave:
             self.wave_number += 1
             self.enemies_killed = 0
             self.enemies_per_wave += ENEMIES_INCREMENT_PER_WAVE # More enemies each wave
             # Spawn enemies faster
-            new_interval = max(MIN_SPAWN_INTERVAL, INITIAL_SPAWN_INTERVAL - (self.wave_number * SPAWN_INTERVAL_DECREASE))
-            pygame.time.set_timer(self.enemy_event, new_interval)
+            self.set_spawn_interval(wave_spawn_interval(self.wave_number))
+
+    # Go straight to a later wave, for load testing: the wave counters and spawn interval are set as if the
+    # earlier waves had been played, and the whole wave of enemies spawns at once.
+    def skip_to_wave(self, wave):
+        self.wave_number = wave
+        self.enemies_killed = 0
+        self.enemies_per_wave = INITIAL_ENEMIES_PER_WAVE + (wave - 1) * ENEMIES_INCREMENT_PER_WAVE
+        if wave > 1:
+            self.set_spawn_interval(wave_spawn_interval(wave))
+        for _ in range(self.enemies_per_wave):
+            self.spawn_enemy()
+
+    # Change how often enemies spawn. Like pygame.time.set_timer, this restarts the countdown.
+    def set_spawn_interval(self, interval):
+        self.spawn_interval = interval
+        self.schedule_spawn(get_ticks())
+
+    # Spawn the next enemy spawn_interval after spawn_time, instead of when the spawn timer was set for before
+    def schedule_spawn(self, spawn_time):
+        self.spawn_time = spawn_time
+        if self.spawn_timer:
+            self.spawn_timer.cancel()
+        self.spawn_timer = schedule(spawn_time + self.spawn_interval, self.spawn_tick)
+
+    # Generate an enemy at one of the spawn positions whenever the spawn interval has passed
+    def spawn_tick(self):
+        self.schedule_spawn(get_ticks())
+        self.spawn_enemy()
+
+    def spawn_enemy(self):
+        enemy_type = self.rng.choice(['normal', 'fast', 'tank'])  # More normals than special
+        folder = self.rng.choice(self.enemy_folders)
+        pos = self.rng.choice(self.spawn_positions)
+        self.add_enemy(pos, folder, enemy_type)
+
+    # Add an enemy of one kind (folder) and type at pos, reusing a pooled one when there is one
+    def add_enemy(self, pos, folder, enemy_type):
+        groups = (self.all_sprites, self.enemy_sprites)
+        frames, masks, death_surf = self.enemy_kind(folder)
+        enemy = self.enemy_pool.take()
+        if enemy:
+            enemy.activate(pos, frames, masks, death_surf, groups, enemy_type)
+            return enemy
+        return Enemy(pos, frames, masks, death_surf,
+            groups, self.player, self.collision_grid, enemy_type, self.enemy_engine, self.flow_field, self.enemy_pool)
     
     # Function that handles collisions between player and enemy.
     def player_collision(self):
-        current_time = pygame.time.get_ticks()
+        current_time = get_ticks()
 
         # Check if player is colliding with any enemy and start tracking the start time for collision
         colliding_enemies = pygame.sprite.spritecollide(self.player, self.enemy_sprites, False, pygame.sprite.collide_mask)
@@ -193,10 +407,12 @@ class Game:
                 if collision_duration >= self.player.collision_damage_delay:
                     # Get the first colliding enemy and use its damage value
                     enemy = colliding_enemies[0]
-                    self.player.take_damage(enemy.damage)
+                    if self.player.take_damage(enemy.damage):
+                        self.damage_taken += enemy.damage
                     self.player.collision_start_time = current_time
                     
                     if self.player.health <= 0:
+                        self.death_cause = enemy.enemy_type
                         self.running = False
          # if player isn't colliding with enemy anymore, reset the timer as well
         else:
@@ -220,11 +436,6 @@ class Game:
                 self.player.health += 1
                 health_pack.kill() 
 
-    # Function that manages player invinsibility. Only after the damage cooldown time from the last time the player took damage 
-    # can the player take damage again.
-    def damage_timer(self):
-        self.player.update_damage_timer()
-
     # Render the player's health as long as player isn't at 0 health. 
     def draw_ui(self):
         if self.player.health > 0:
@@ -233,45 +444,69 @@ class Game:
             y = WINDOW_HEIGHT - heart_bar.get_height() - 10
             self.display_surface.blit(heart_bar, (x, y))
             
-            #Also display the wave number
-            self.display_surface.blit(self.wave_text_font.render(f"Wave: {self.wave_number}", True, (255, 255, 255)), (10, 10))
+            #Also display the wave number. The label is only rendered again when the wave changes.
+            if self.wave_label_number != self.wave_number:
+                self.wave_label = self.wave_text_font.render(f"Wave: {self.wave_number}", True, (255, 255, 255))
+                self.wave_label_number = self.wave_number
+            self.display_surface.blit(self.wave_label, (10, 10))
     # Game loop that runs the game. 
     def run(self):
-        start_screen = StartScreen(self.display_surface, self.clock)
-        action = start_screen.show()
-        
-        # If user quit from start screen, exit
-        if action != ScreenAction.START_GAME:
-            pygame.quit()
-            return
+        # A replay starts playing at once
+        if not self.replay:
+            start_screen = StartScreen(self.display_surface, self.clock)
+            action = start_screen.show()
+
+            # If user quit from start screen, exit
+            if action != ScreenAction.START_GAME:
+                pygame.quit()
+                return
+
+        # The game has usually finished loading while the start screen was up. If not, wait for it here.
+        self.loading.result()
         
+        # Spawns are counted on the game clock, which stood still while the start screen was up, so a new game
+        # still waits the whole spawn interval for its first enemy. A resumed game keeps the countdown it had.
+        self.clock.tick()
+        # Real time not yet simulated, in seconds. Each frame adds the time since the last one, and the game
+        # steps by FIXED_DT until less than a step is left. The rest carries over to the next frame.
+        accumulator = 0
         while self.running:
-            dt = self.clock.tick() / 1000
+            accumulator += min(self.clock.tick(self.frame_cap) / 1000, MAX_FRAME_TIME)
+            self.profiler.start_frame()
         # If user clicks the button that closes the window, quit the game. 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.running = False
+                # F3 shows or hides the profiling overlay
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.profiler.toggle_overlay()
+            self.profiler.mark('events')
+
+            while accumulator >= FIXED_DT and self.running:
+                self.all_sprites.remember_positions()
+                self.step()
+                accumulator -= FIXED_DT
+                if self.replay_finished():
+                    self.running = False
 
-                # Generate an enemy at one of the spawn positions 
-                if event.type == self.enemy_event:
-                        enemy_type = choice(['normal', 'fast', 'tank'])  # More normals than special
-                        Enemy(choice(self.spawn_positions), choice(list(self.enemy_frames.values())), 
-                            (self.all_sprites, self.enemy_sprites), self.player, self.collision_sprites, enemy_type)
-            # update game states
-            self.gun_timer()
-            self.damage_timer() 
-            self.input()
-            self.all_sprites.update(dt)
-            self.bullet_collision()
-            self.player_collision()
-            self.home_collision()
-            self.health_pack_collision()
-
-            # draw
+            # draw, with moving sprites part of the way from their last position to the current one, by how
+            # far real time has got into the next step
+            alpha = accumulator / FIXED_DT
             self.display_surface.fill('black')
-            self.all_sprites.draw(self.player.rect.center)
+            self.all_sprites.draw(self.all_sprites.interpolated_center(self.player, alpha), alpha)
+            self.profiler.mark('draw')
             self.draw_ui()
+            self.profiler.draw(self.display_surface)
+            self.profiler.mark('draw_ui')
             pygame.display.update()
+            self.profiler.mark('display_update')
+        self.save_recording()
+
+        # A replay just closes when it is over
+        if self.replay:
+            self.profiler.save()
+            pygame.quit()
+            return
         
         # If game_won is true, display the won screen. Otherwise, show the game over screen
         # Also check if player wants to play again, and start a new game if so.
@@ -286,10 +521,106 @@ class Game:
             self.reset_game()
             self.run()
         else:
+            self.profiler.save()
             pygame.quit()
     
+    # update game states for one frame of dt seconds, timing each step
+    # The timers (enemy spawns, gun cooldown, invincibility, bullet lifetimes and enemy death animations) have
+    # already run when step advanced the game clock, and count as the 'timers' phase.
+    def update(self, dt):
+        profiler = self.profiler
+        profiler.mark('timers')
+        self.input()
+        profiler.mark('input')
+        self.all_sprites.update(dt)
+        self.enemy_scheduler.update(dt)
+        if self.enemy_engine:
+            self.enemy_engine.update()
+        if self.projectiles:
+            self.projectiles.update(dt)
+        profiler.mark('sprites_update')
+        self.bullet_collision()
+        profiler.mark('bullet_collision')
+        self.player_collision()
+        profiler.mark('player_collision')
+        self.home_collision()
+        self.health_pack_collision()
+        profiler.mark('pickup_collision')
+        profiler.count({
+            'sprites': len(self.all_sprites),
+            'enemies': len(self.enemy_sprites),
+            'bullets': self.projectiles.count if self.projectiles else len(self.bullet_sprites),
+            'health_packs': len(self.health_pack_sprites),
+        })
+
+    # Advance the game by one step of dt seconds: the game clock first, which runs the timers that are due, then everything else
+    def step(self, dt = FIXED_DT):
+        self.sim_clock.advance(dt)
+        self.update(dt)
+        self.steps += 1
+        if self.checkpoint_path and self.running and self.sim_clock.time >= self.next_checkpoint:
+            self.save_snapshot(self.checkpoint_path)
+
+    # Save the whole game state to path, to be picked up again with load_snapshot
+    def save_snapshot(self, path):
+        write_snapshot(self, path)
+        self.next_checkpoint = self.sim_clock.time + CHECKPOINT_INTERVAL
+
+    # Carry on from a snapshot saved by save_snapshot, in place of the current game. A windowed game first
+    # finishes loading.
+    def load_snapshot(self, path):
+        self.loading.result()
+        read_snapshot(self, path)
+        self.next_checkpoint = self.sim_clock.time + CHECKPOINT_INTERVAL
+
+    # A replay ends where the recorded game ended, also when that was the player closing the window
+    def replay_finished(self):
+        return self.replay is not None and self.steps >= self.replay.steps
+
+    # Headless game loop. Steps the game by a fixed dt, with no events, drawing or frame limit,
+    # until the player wins, dies, or max_time milliseconds of game time (or the replay) have passed.
+    def simulate(self, dt = FIXED_DT, max_time = HEADLESS_MAX_TIME):
+        while self.running and self.sim_clock.get_ticks() < max_time and not self.replay_finished():
+            self.profiler.start_frame()
+            self.step(dt)
+        if self.running:
+            self.death_cause = 'timeout'
+        self.save_recording()
+        self.profiler.save()
+        return self.game_won
+
+    # Save the replay of the game that just ended, when recording. The first game goes to record_path and later
+    # ones (play again) next to it, numbered: replay.bin, replay-2.bin, replay-3.bin, ...
+    def save_recording(self):
+        if not self.recorder:
+            return
+        path = self.record_path
+        if self.games_recorded:
+            base, extension = os.path.splitext(path)
+            path = f'{base}-{self.games_recorded + 1}{extension}'
+        self.recorder.replay.steps = self.steps
+        self.recorder.replay.save(path)
+        self.games_recorded += 1
+
+    # Summary of a finished headless game. time is the game time in seconds when it ended, which for a
+    # won game is the time it took to reach the home. cause_of_death is the type of the enemy that dealt
+    # the last damage, 'timeout' if the time limit ran out, or None for a won game.
+    def result(self):
+        return {
+            'won': self.game_won,
+            'wave': self.wave_number,
+            'kills': self.total_kills,
+            'damage_taken': self.damage_taken,
+            'time': get_ticks() / 1000,
+            'cause_of_death': self.death_cause,
+        }
+
     # Function that resets the game variables for a new game.
-    def reset_game(self):
+    # A seed restarts the random choices, so the new game is the same as Game(seed = seed) would play.
+    # Without one, the new game gets a random seed.
+    def reset_game(self, seed = None):
+        if self.enemy_engine:
+            self.enemy_engine.clear()
         self.all_sprites.empty()
         self.collision_sprites.empty()
         self.bullet_sprites.empty()
@@ -299,6 +630,9 @@ class Game:
 
         self.game_won = False
         self.running = True
+        self.total_kills = 0
+        self.damage_taken = 0
+        self.death_cause = None
         
         self.can_shoot = True
         self.shoot_time = 0
@@ -307,14 +641,86 @@ class Game:
         self.wave_number = 1
         self.enemies_killed = 0
         self.enemies_per_wave = INITIAL_ENEMIES_PER_WAVE
+        self.seed = check_seed(seed) if seed is not None else getrandbits(64)
+        self.rng.seed(self.seed)
+        self.steps = 0
+        self.next_checkpoint = CHECKPOINT_INTERVAL
+        self.controller.reset()
+        if self.recorder:
+            self.recorder.start(self.seed)
+
+        # A new game starts again from time 0 on a fresh clock
+        self.sim_clock = SimulationClock()
+        use_clock(self.sim_clock)
+
         # Reset enemy spawn timer to initial 2 seconds
-        pygame.time.set_timer(self.enemy_event, INITIAL_SPAWN_INTERVAL)
+        self.set_spawn_interval(INITIAL_SPAWN_INTERVAL)
 
         self.spawn_positions = []
         
         self.setup()
 
 
+# Milliseconds between enemy spawns in a wave after the first
+def wave_spawn_interval(wave):
+    return max(MIN_SPAWN_INTERVAL, INITIAL_SPAWN_INTERVAL - (wave * SPAWN_INTERVAL_DECREASE))
+
+# Replays and snapshots (checkpoints too) store the seed as a 64-bit unsigned number, so games only take those
+def check_seed(seed):
+    if not 0 <= seed < 2 ** 64:
+        raise ValueError(f'the seed must be from 0 to {2 ** 64 - 1}, not {seed}')
+    return seed
+
+def seed_argument(text):
+    seed = int(text)
+    try:
+        return check_seed(seed)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error)) from None
+
 if __name__ == '__main__':
-    game = Game()
-    game.run() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description = 'Help Susie Get Home')
+    parser.add_argument('--headless', action = 'store_true', help = 'play one game with the bot, without a window')
+    parser.add_argument('--seed', type = seed_argument, default = None, help = 'random seed for enemy and home placement')
+    parser.add_argument('--profile', metavar = 'PATH', default = None, help = 'write per-frame timings to a .csv or .json file at exit')
+    parser.add_argument('--fps', type = int, default = FRAME_CAP, help = 'frames per second to draw at most, 0 for no limit (default %(default)s)')
+    parser.add_argument('--record', metavar = 'PATH', default = None, help = 'save a replay of each game to PATH')
+    parser.add_argument('--replay', metavar = 'PATH', default = None, help = 'play a recorded game again')
+    parser.add_argument('--fast', action = 'store_true', help = 'with --replay, play it as fast as possible without a window and print the result')
+    parser.add_argument('--checkpoint', metavar = 'PATH', default = None, help = 'save a snapshot of the game to PATH every CHECKPOINT_INTERVAL of game time')
+    parser.add_argument('--resume', metavar = 'PATH', default = None, help = 'carry on from a snapshot (such as a checkpoint)')
+    parser.add_argument('--wave', type = int, default = None, help = 'start at this wave, with the whole wave spawned at once')
+    args = parser.parse_args()
+    # Replays start from the seed alone, so they cannot be combined with a game that starts somewhere else
+    if (args.resume or args.wave) and (args.replay or args.record):
+        parser.error('--resume and --wave cannot be used with --replay or --record')
+
+    # Start the game from the snapshot or wave asked for
+    def start(game):
+        if args.resume:
+            game.load_snapshot(args.resume)
+        elif args.wave:
+            game.loading.result()
+            game.skip_to_wave(args.wave)
+            # Saved right away, so the wave can be loaded again without skipping to it
+            if args.checkpoint:
+                game.save_snapshot(args.checkpoint)
+
+    if args.replay:
+        replay = load_replay(args.replay)
+        if args.fast:
+            game = Game(headless = True, replay = replay, profile_path = args.profile)
+            game.simulate(max_time = float('inf'))
+            print(game.result())
+        else:
+            game = Game(replay = replay, profile_path = args.profile, frame_cap = args.fps)
+            game.run()
+    elif args.headless:
+        game = Game(headless = True, seed = args.seed, profile_path = args.profile, record_path = args.record, checkpoint_path = args.checkpoint)
+        start(game)
+        game.simulate()
+        print(game.result())
+    else:
+        game = Game(seed = args.seed, profile_path = args.profile, frame_cap = args.fps, record_path = args.record, checkpoint_path = args.checkpoint)
+        start(game)
+        game.run() 
\ No newline at end of file
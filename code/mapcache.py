@@ -0,0 +1,199 @@
+from settings import *
+from array import array
+from hashlib import sha1
+from pytmx import TiledTileLayer, TiledObjectGroup
+from pytmx.util_pygame import load_pygame
+import os
+import pickle
+import zlib
+import xml.etree.ElementTree as ElementTree
+
+# Binary cache of a Tiled map. Parsing world.tmx and its two .tsx tilesets with pytmx is slow, so the first
+# load writes everything Game.setup uses into <map>.cache next to the map: the tile layers as arrays of
+# image numbers, the objects of every object layer, and all images packed into one atlas. Later loads read
+# that file instead. The cache stores the size and mtime of the map, its tilesets and their images, plus a
+# hash of the .tmx/.tsx files, and is rebuilt as soon as any of them changes.
+
+# Bump this when the layout of the cache file changes
+CACHE_VERSION = 1
+ATLAS_WIDTH = 2048
+
+# Tile layer of a cached map. tiles() yields (x, y, image) like the pytmx layer does.
+class TileLayer:
+    def __init__(self, name, width, height, grid, images):
+        self.name = name
+        self.width, self.height = width, height
+        self.grid = grid
+        self.images = images
+
+    def tiles(self):
+        for index, number in enumerate(self.grid):
+            if number:
+                y, x = divmod(index, self.width)
+                yield x, y, self.images[number - 1]
+
+# Object of a cached object layer, with the attributes Game.setup reads from pytmx objects
+class MapObject:
+    __slots__ = ('name', 'x', 'y', 'width', 'height', 'image')
+
+    def __init__(self, name, x, y, width, height, image):
+        self.name = name
+        self.x, self.y = x, y
+        self.width, self.height = width, height
+        self.image = image
+
+# The whole map, looked up by layer name like a pytmx map
+class WorldMap:
+    def __init__(self, data):
+        atlas = pygame.image.fromstring(zlib.decompress(data['atlas']), data['atlas_size'], 'RGBA').convert_alpha()
+        images = [atlas.subsurface(rect) for rect in data['atlas_rects']]
+
+        self.layers = {}
+        for name, width, height, grid in data['tile_layers']:
+            self.layers[name] = TileLayer(name, width, height, array('H', grid), images)
+        for name, objects in data['object_layers']:
+            self.layers[name] = [
+                MapObject(obj_name, x, y, width, height, images[image] if image >= 0 else None)
+                for obj_name, x, y, width, height, image in objects
+            ]
+
+    def get_layer_by_name(self, name):
+        return self.layers[name]
+
+# Load a map through the cache, building the cache first if it is missing or out of date
+def load_world(tmx_path):
+    cache_path = os.path.splitext(tmx_path)[0] + '.cache'
+    data = read_cache(cache_path, tmx_path)
+    if data is None:
+        data = build_cache_data(tmx_path)
+        write_cache(cache_path, data)
+    return WorldMap(data)
+
+def read_cache(cache_path, tmx_path):
+    try:
+        with open(cache_path, 'rb') as file:
+            data = pickle.load(file)
+    except (OSError, pickle.PickleError, EOFError, ValueError):
+        return None
+    if data.get('version') != CACHE_VERSION or not dependencies_unchanged(os.path.dirname(tmx_path), data['dependencies']):
+        return None
+    return data
+
+# Write to a temporary file first so a crash never leaves half a cache behind.
+# A read-only install just keeps parsing the map every time.
+def write_cache(cache_path, data):
+    temp_path = cache_path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as file:
+            pickle.dump(data, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass
+
+# Parse the map with pytmx and turn it into plain data that can be pickled
+def build_cache_data(tmx_path):
+    tmx = load_pygame(tmx_path)
+
+    # Every distinct image gets a number. Tile layers store number + 1 so 0 can mean an empty cell.
+    images = []
+    numbers = {}
+    def image_number(surf):
+        if surf is None:
+            return -1
+        if id(surf) not in numbers:
+            numbers[id(surf)] = len(images)
+            images.append(surf)
+        return numbers[id(surf)]
+
+    tile_layers = []
+    object_layers = []
+    for layer in tmx.layers:
+        if isinstance(layer, TiledTileLayer):
+            grid = array('H', bytes(2 * layer.width * layer.height))
+            for x, y, surf in layer.tiles():
+                grid[y * layer.width + x] = image_number(surf) + 1
+            tile_layers.append((layer.name, layer.width, layer.height, grid.tobytes()))
+        elif isinstance(layer, TiledObjectGroup):
+            objects = [(obj.name, obj.x, obj.y, obj.width, obj.height, image_number(obj.image)) for obj in layer]
+            object_layers.append((layer.name, objects))
+
+    atlas, atlas_rects = pack_atlas(images)
+    map_dir = os.path.dirname(tmx_path)
+    return {
+        'version': CACHE_VERSION,
+        'dependencies': [dependency_record(map_dir, path) for path in map_dependencies(tmx_path)],
+        'tile_layers': tile_layers,
+        'object_layers': object_layers,
+        # Most of the atlas is transparent, so even the fastest compression level shrinks it a lot
+        'atlas': zlib.compress(pygame.image.tostring(atlas, 'RGBA'), 1),
+        'atlas_size': atlas.get_size(),
+        'atlas_rects': atlas_rects,
+    }
+
+# Pack the images into rows on one surface, tallest first, and return it with each image's rect
+def pack_atlas(images):
+    size, rects = atlas_layout([surf.get_size() for surf in images])
+    atlas = pygame.Surface(size, pygame.SRCALPHA)
+    for surf, rect in zip(images, rects):
+        atlas.blit(surf, rect[:2])
+    return atlas, rects
+
+# Where pack_atlas puts images of the given (width, height) sizes: the atlas size and each image's rect
+def atlas_layout(sizes, atlas_width = ATLAS_WIDTH):
+    width = max([atlas_width] + [size[0] for size in sizes])
+    rects = [None] * len(sizes)
+    x = y = row_height = 0
+    for number in sorted(range(len(sizes)), key = lambda number: -sizes[number][1]):
+        surf_width, surf_height = sizes[number]
+        if x + surf_width > width:
+            x, y, row_height = 0, y + row_height, 0
+        rects[number] = (x, y, surf_width, surf_height)
+        x += surf_width
+        row_height = max(row_height, surf_height)
+    return (width, max(y + row_height, 1)), rects
+
+# The map file, the external tilesets it uses and every image those reference
+def map_dependencies(tmx_path):
+    paths = [tmx_path]
+    to_scan = [tmx_path]
+    while to_scan:
+        path = to_scan.pop()
+        folder = os.path.dirname(path)
+        for element in ElementTree.parse(path).getroot().iter():
+            source = element.get('source')
+            if element.tag in ('tileset', 'image') and source:
+                source_path = os.path.normpath(os.path.join(folder, source))
+                paths.append(source_path)
+                if element.tag == 'tileset':
+                    to_scan.append(source_path)
+    return paths
+
+# (relative path, (size, mtime), hash). Only the map and tileset files are hashed; images are compared by stat.
+def dependency_record(map_dir, path):
+    digest = file_hash(path) if path.endswith(('.tmx', '.tsx')) else None
+    return os.path.relpath(path, map_dir), file_stat(path), digest
+
+def dependencies_unchanged(map_dir, dependencies):
+    for relative_path, stat, digest in dependencies:
+        path = os.path.join(map_dir, relative_path)
+        current = file_stat(path)
+        if current == stat:
+            continue
+        # A checkout can touch a file without changing it, so the text files get a second look by hash
+        if digest is None or current is None or file_hash(path) != digest:
+            return False
+    return True
+
+def file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def file_hash(path):
+    try:
+        with open(path, 'rb') as file:
+            return sha1(file.read()).hexdigest()
+    except OSError:
+        return None
@@ -1,22 +1,27 @@
 from settings import * 
 from utils import get_asset_path, handle_collision
+from assets import load_image, load_mask
+from timing import get_ticks, schedule
 
 class Player(pygame.sprite.Sprite):
     # Initialize the player with frames, position, movement capabilities,
     # and collision detection. Sets up the player's hitbox smaller than the sprite
+    # The controller (see controls.py) supplies movement and aiming, from the keyboard and mouse or from a bot.
  
-    def __init__(self, pos, groups, collision_sprites):
+    def __init__(self, pos, groups, collision_grid, controller):
         super().__init__(groups)
         self.load_images()
         self.state, self.frame_index = 'right', 0
         self.image = self.frames['down'][0]
+        self.mask = self.masks['down'][0]
         self.rect = self.image.get_rect(center = pos)
         self.hitbox_rect = self.rect.inflate(PLAYER_HITBOX_INFLATE)
     
         # movement 
         self.direction = pygame.Vector2()
         self.speed = PLAYER_SPEED
-        self.collision_sprites = collision_sprites
+        self.collision_grid = collision_grid
+        self.controller = controller
 
          # health system, with 0.5 second invincibility to the player right after damage is taken
         self.max_health = PLAYER_MAX_HEALTH
@@ -32,9 +37,10 @@ class Player(pygame.sprite.Sprite):
         self.collision_damage_delay = PLAYER_COLLISION_DAMAGE_DELAY
 
     # Load all player animation frames from the folders for each direction (left, right, up, down).
-    # Then stores the images in dictionary
+    # Then stores the images in dictionary, along with a collision mask for every frame
     def load_images(self):
         self.frames = {'left': [], 'right': [], 'up': [], 'down': []}
+        self.masks = {'left': [], 'right': [], 'up': [], 'down': []}
 
         for state in self.frames.keys():
             state_path = get_asset_path('images', 'player1', state)
@@ -50,22 +56,17 @@ class Player(pygame.sprite.Sprite):
 
                 for file_name in sorted(frame_files, key=lambda name: int(name.split('.')[0])):
                     full_path = join(folder_path, file_name)
-                    surf = pygame.image.load(full_path).convert_alpha()
 
+                    # Frames and masks are shared between every Player through the asset cache
                     scale_factor = PLAYER_SCALE_FACTOR
-                    new_width = int(surf.get_width() * scale_factor)
-                    new_height = int(surf.get_height() * scale_factor)
-                    surf = pygame.transform.scale(surf, (new_width, new_height))
-                    
-                    self.frames[state].append(surf)
+                    self.frames[state].append(load_image(full_path, scale = scale_factor))
+                    self.masks[state].append(load_mask(full_path, scale = scale_factor))
 
                    
-    # Read keyboard input (arrow keys or WASD) and set the player's movement direction
+    # Read the movement input (arrow keys or WASD when playing) and set the player's movement direction
     # Normalizes diagonal movement so speed is consistent in all directions
     def input(self):
-        keys = pygame.key.get_pressed()
-        self.direction.x = int(keys[pygame.K_RIGHT] or keys[pygame.K_d]) - int(keys[pygame.K_LEFT] or keys[pygame.K_a])
-        self.direction.y = int(keys[pygame.K_DOWN] or keys[pygame.K_s]) - int(keys[pygame.K_UP] or keys[pygame.K_w])
+        self.direction = self.controller.movement()
         self.direction = self.direction.normalize() if self.direction else self.direction
 
      # Move player based on direction and speed, handling collisions separately for horizontal
@@ -80,7 +81,7 @@ class Player(pygame.sprite.Sprite):
     # Handle collisions with obstacles by adjusting the player's hitbox position to prevent overlap.
     # Checks collision direction (horizontal or vertical) and adjusts position accordingly.
     def collision(self, direction):
-        handle_collision(self.hitbox_rect, self.collision_sprites, direction, self.direction)
+        handle_collision(self.hitbox_rect, self.collision_grid, direction, self.direction)
     
      # Update the player's appearance based on movement direction. Changes state (left/right/up/down)
     # and cycles through animation frames. Resets to frame 0 when stationary.
@@ -94,7 +95,9 @@ class Player(pygame.sprite.Sprite):
 
         # animate
         self.frame_index = self.frame_index + 5 * dt if self.direction else 0
-        self.image = self.frames[self.state][int(self.frame_index) % len(self.frames[self.state])]
+        index = int(self.frame_index) % len(self.frames[self.state])
+        self.image = self.frames[self.state][index]
+        self.mask = self.masks[self.state][index]
     
     #  update loop, called every frame. Processes input, moves the player, updates animation / visual appearance
     def update(self, dt):
@@ -105,15 +108,16 @@ class Player(pygame.sprite.Sprite):
     def take_damage(self, amount):
         if self.can_take_damage:
             self.health -= amount
-            self.can_take_damage = False
-            self.damage_time = pygame.time.get_ticks()
+            self.start_invincibility(get_ticks())
             return True
         return False
-    # Update invincibility timer
-    def update_damage_timer(self):
-        if not self.can_take_damage:
-            if pygame.time.get_ticks() - self.damage_time >= self.damage_cooldown:
-                self.can_take_damage = True
+    # Make the player invincible for the damage cooldown from damage_time on
+    def start_invincibility(self, damage_time):
+        self.can_take_damage = False
+        self.damage_time = damage_time
+        schedule(damage_time + self.damage_cooldown, self.end_invincibility)
+    def end_invincibility(self):
+        self.can_take_damage = True
     #  Reset health to max (for new game)
     def reset_health(self):
         self.health = self.max_health
@@ -0,0 +1,21 @@
+# Free list of sprites that can be used again. Bullets and enemies are created and destroyed many times
+# a second in big waves, so instead of building a new sprite (with its rect, vectors and group entries)
+# every time, a finished sprite is deactivated and put here, and the next one is an old one activated again.
+#
+# A pooled sprite has activate(...), which resets it and adds it to its groups, and deactivate(), which
+# removes it from all groups and releases it back to its pool. kill() deactivates.
+class SpritePool:
+    def __init__(self):
+        self.free = []
+
+    # A deactivated sprite to activate again, or None if the pool is empty and a new one has to be made
+    def take(self):
+        return self.free.pop() if self.free else None
+
+    def release(self, sprite):
+        self.free.append(sprite)
+
+    # Build count sprites up front with create() and park them in the pool
+    def fill(self, count, create):
+        for _ in range(count):
+            create().deactivate()
@@ -0,0 +1,130 @@
+from settings import *
+from assets import load_font
+from collections import deque
+from time import perf_counter
+import csv
+import json
+
+# Lightweight per-frame instrumentation. The game calls start_frame() once per frame and mark(name) after
+# each phase, which records the time since the previous mark. A frame costs one perf_counter() call per phase
+# and a few list operations, so it can stay on all the time.
+#
+# The last PROFILER_WINDOW frames are kept for the overlay (F3 in game) and for percentiles. With a trace
+# path set, every frame is also kept and written out as CSV or JSON (by file extension) when save() is called.
+class FrameProfiler:
+    def __init__(self, trace_path = None, window = PROFILER_WINDOW):
+        self.trace_path = trace_path
+        self.trace = [] if trace_path else None
+        self.frames = deque(maxlen = window)
+        self.phases = []
+        self.frame_start = None
+        self.last_mark = None
+        self.timings = {}
+        self.counts = {}
+        self.frame_number = 0
+
+        # overlay
+        self.visible = False
+        self.font = None
+        self.overlay_lines = []
+        self.overlay_time = 0
+
+    # Begin a new frame. The frame time of the previous frame is the time between the two start_frame calls,
+    # so it includes display updates and waiting in clock.tick().
+    def start_frame(self):
+        now = perf_counter()
+        if self.frame_start is not None:
+            self.end_frame(now)
+        self.frame_start = self.last_mark = now
+        self.timings = {}
+
+    def mark(self, phase):
+        now = perf_counter()
+        self.timings[phase] = self.timings.get(phase, 0) + (now - self.last_mark) * 1000
+        self.last_mark = now
+        if phase not in self.phases:
+            self.phases.append(phase)
+
+    # Sprite counts for the current frame, e.g. {'enemies': 120}
+    def count(self, counts):
+        self.counts = counts
+
+    def end_frame(self, now):
+        frame = (self.frame_number, (now - self.frame_start) * 1000, self.timings, self.counts)
+        self.frames.append(frame)
+        if self.trace is not None:
+            self.trace.append(frame)
+        self.frame_number += 1
+
+    # Frame time percentiles in milliseconds over the recent window, e.g. {50: 16.6, 95: 17.1, 99: 25.0}
+    def percentiles(self, points = (50, 95, 99)):
+        times = sorted(frame[1] for frame in self.frames)
+        if not times:
+            return {}
+        return {point: times[min(len(times) - 1, int(len(times) * point / 100))] for point in points}
+
+    # Average milliseconds spent in each phase over the recent window
+    def phase_averages(self):
+        totals = dict.fromkeys(self.phases, 0)
+        for frame in self.frames:
+            for phase, duration in frame[2].items():
+                totals[phase] += duration
+        return {phase: total / max(len(self.frames), 1) for phase, total in totals.items()}
+
+    def toggle_overlay(self):
+        self.visible = not self.visible
+
+    # Draw the overlay in the top right corner. The text is only rebuilt a few times per second.
+    def draw(self, surface):
+        if not self.visible:
+            return
+        if self.font is None:
+            self.font = load_font(22)
+
+        now = perf_counter()
+        if now - self.overlay_time >= PROFILER_OVERLAY_REFRESH:
+            self.overlay_time = now
+            lines = []
+            percentiles = self.percentiles()
+            if percentiles:
+                lines.append(('frame ms', '  '.join(f'p{point} {value:.1f}' for point, value in percentiles.items())))
+                lines.append(('fps', '  '.join(f'p{point} {1000 / max(value, 0.001):.0f}' for point, value in percentiles.items())))
+            lines += [(phase, f'{duration:.2f} ms') for phase, duration in self.phase_averages().items()]
+            lines += [(name, str(count)) for name, count in self.counts.items()]
+            self.overlay_lines = [(self.font.render(label, True, 'white'), self.font.render(value, True, 'white')) for label, value in lines]
+
+        # Labels on the left and values on the right of a dark panel
+        if self.overlay_lines:
+            line_height = self.overlay_lines[0][0].get_height()
+            panel = pygame.Rect(0, 0, PROFILER_OVERLAY_WIDTH, line_height * len(self.overlay_lines) + 10)
+            panel.topright = (WINDOW_WIDTH - 10, 10)
+            surface.fill('black', panel)
+            for index, (label, value) in enumerate(self.overlay_lines):
+                y = panel.top + 5 + index * line_height
+                surface.blit(label, (panel.left + 5, y))
+                surface.blit(value, (panel.right - 5 - value.get_width(), y))
+
+    # Write the full trace, one row or object per frame
+    def save(self):
+        if not self.trace_path:
+            return
+        # The last frame has no following start_frame to close it
+        if self.frame_start is not None:
+            self.end_frame(perf_counter())
+            self.frame_start = None
+        count_names = sorted({name for frame in self.trace for name in frame[3]})
+        if self.trace_path.endswith('.json'):
+            with open(self.trace_path, 'w') as file:
+                json.dump({
+                    'phases': self.phases,
+                    'frames': [{'frame': number, 'frame_ms': frame_ms, 'phases': timings, 'counts': counts}
+                               for number, frame_ms, timings, counts in self.trace],
+                }, file)
+        else:
+            with open(self.trace_path, 'w', newline = '') as file:
+                writer = csv.writer(file)
+                writer.writerow(['frame', 'frame_ms'] + [f'{phase}_ms' for phase in self.phases] + count_names)
+                for number, frame_ms, timings, counts in self.trace:
+                    writer.writerow([number, round(frame_ms, 4)]
+                                    + [round(timings.get(phase, 0), 4) for phase in self.phases]
+                                    + [counts.get(name, 0) for name in count_names])
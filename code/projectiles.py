@@ -0,0 +1,142 @@
+from settings import *
+from horde import numpy, round_like_rect
+from timing import get_ticks, schedule
+
+# All live bullets as one set of numpy arrays instead of one sprite each: center position, velocity and spawn
+# time, in the order they were fired. A frame moves every bullet and expires the old ones with a few array
+# operations, checks them against enemies and obstacles together, and draws them with a single blits() call.
+# Firing many bullets at once (BULLETS_PER_SHOT) only adds array rows.
+#
+# Bullets move like the Bullet sprite did: their centers are rounded like a pygame Rect after every step, and
+# hits are checked in the same order with the same masks, so games play out the same either way.
+#
+# Bullets stay in firing order, so the oldest ones are always first and the bullets that run out are the first
+# few. A timer on the game clock for each firing time drops them when their lifetime is over.
+class Projectiles:
+    def __init__(self, surf, mask, obstacles, capacity = BULLET_CAPACITY):
+        self.surf = surf
+        self.mask = mask
+        self.width, self.height = surf.get_size()
+        self.lifetime = BULLET_LIFETIME
+        self.speed = BULLET_SPEED
+
+        rects = [sprite.rect for sprite in obstacles]
+        self.obstacle_left = numpy.array([rect.left for rect in rects], dtype = float)
+        self.obstacle_top = numpy.array([rect.top for rect in rects], dtype = float)
+        self.obstacle_right = numpy.array([rect.right for rect in rects], dtype = float)
+        self.obstacle_bottom = numpy.array([rect.bottom for rect in rects], dtype = float)
+
+        self.count = 0
+        self.x = numpy.zeros(capacity)
+        self.y = numpy.zeros(capacity)
+        # Centers before the last game step, for drawing between steps
+        self.previous_x = numpy.zeros(capacity)
+        self.previous_y = numpy.zeros(capacity)
+        self.velocity_x = numpy.zeros(capacity)
+        self.velocity_y = numpy.zeros(capacity)
+        self.spawn_time = numpy.zeros(capacity)
+        # The last firing time with an expiry timer
+        self.expiry_time = None
+
+    def grow(self):
+        for name in ('x', 'y', 'previous_x', 'previous_y', 'velocity_x', 'velocity_y', 'spawn_time'):
+            array = getattr(self, name)
+            setattr(self, name, numpy.concatenate([array, numpy.zeros_like(array)]))
+
+    # Fire one bullet centered on pos, flying in direction (a unit vector)
+    def fire(self, pos, direction):
+        if self.count == len(self.x):
+            self.grow()
+        index = self.count
+        self.x[index], self.y[index] = round_like_rect(numpy.array(pos))
+        self.previous_x[index], self.previous_y[index] = self.x[index], self.y[index]
+        self.velocity_x[index], self.velocity_y[index] = direction * self.speed
+        self.spawn_time[index] = get_ticks()
+        self.count += 1
+        self.schedule_expiry(self.spawn_time[index])
+
+    # Bullets fired at the same time run out together, with one timer for all of them
+    def schedule_expiry(self, spawn_time):
+        if spawn_time != self.expiry_time:
+            self.expiry_time = spawn_time
+            schedule(spawn_time + self.lifetime, self.expire)
+
+    # Drop the bullets whose lifetime is over, which are the oldest ones
+    def expire(self):
+        count = self.count
+        expired = int(numpy.searchsorted(self.spawn_time[:count], get_ticks() - self.lifetime, side = 'right'))
+        if not expired:
+            return
+        for array in (self.x, self.y, self.previous_x, self.previous_y, self.velocity_x, self.velocity_y, self.spawn_time):
+            array[:count - expired] = array[expired:count]
+        self.count = count - expired
+
+    # Keep only the bullets where keep is True, in their current order
+    def keep(self, keep):
+        count = int(keep.sum())
+        for array in (self.x, self.y, self.previous_x, self.previous_y, self.velocity_x, self.velocity_y, self.spawn_time):
+            array[:count] = array[:self.count][keep]
+        self.count = count
+
+    def remember_positions(self):
+        self.previous_x[:self.count] = self.x[:self.count]
+        self.previous_y[:self.count] = self.y[:self.count]
+
+    def update(self, dt):
+        count = self.count
+        if not count:
+            return
+        self.x[:count] = round_like_rect(self.x[:count] + self.velocity_x[:count] * dt)
+        self.y[:count] = round_like_rect(self.y[:count] + self.velocity_y[:count] * dt)
+
+    # Bullet rects as left, top, right and bottom arrays
+    def rects(self):
+        left = self.x[:self.count] - self.width // 2
+        top = self.y[:self.count] - self.height // 2
+        return left, top, left + self.width, top + self.height
+
+    # Find the enemies each bullet hits. For every bullet that hits something, yields the list of enemies it hit
+    # (rect overlap, then the same mask test as pygame.sprite.collide_mask), in bullet order. The caller handles
+    # each list before the next one is worked out, so a later bullet sees an enemy killed by an earlier one.
+    # Once all hits are handled, the bullets that hit an enemy or an obstacle are removed.
+    def collide(self, enemies):
+        if not self.count:
+            return
+        left, top, right, bottom = self.rects()
+        spent = numpy.zeros(self.count, dtype = bool)
+
+        enemies = list(enemies)
+        if enemies:
+            enemy_rects = numpy.array([tuple(enemy.rect) for enemy in enemies], dtype = float)
+            enemy_left, enemy_top = enemy_rects[:, 0], enemy_rects[:, 1]
+            enemy_right, enemy_bottom = enemy_left + enemy_rects[:, 2], enemy_top + enemy_rects[:, 3]
+            overlap = ((left[:, None] < enemy_right) & (right[:, None] > enemy_left)
+                       & (top[:, None] < enemy_bottom) & (bottom[:, None] > enemy_top))
+            for bullet in numpy.flatnonzero(overlap.any(axis = 1)).tolist():
+                bullet_left, bullet_top = int(left[bullet]), int(top[bullet])
+                hit = [enemies[index] for index in numpy.flatnonzero(overlap[bullet]).tolist()
+                       if self.mask.overlap(enemies[index].mask, (enemies[index].rect.x - bullet_left, enemies[index].rect.y - bullet_top))]
+                if hit:
+                    spent[bullet] = True
+                    yield hit
+
+        # Bullets that hit nothing still stop at trees, rocks and the map border
+        blocked = ((left[:, None] < self.obstacle_right) & (right[:, None] > self.obstacle_left)
+                   & (top[:, None] < self.obstacle_bottom) & (bottom[:, None] > self.obstacle_top)).any(axis = 1)
+        spent |= blocked
+        if spent.any():
+            self.keep(~spent)
+
+    # Draw every bullet in the window with one blits() call. offset is the camera offset of AllSprites, and
+    # alpha how far to draw bullets from their previous centers to their current ones (see AllSprites.draw).
+    def draw(self, surface, offset, alpha = 1):
+        if not self.count:
+            return
+        count = self.count
+        x = self.previous_x[:count] + (self.x[:count] - self.previous_x[:count]) * alpha
+        y = self.previous_y[:count] + (self.y[:count] - self.previous_y[:count]) * alpha
+        left, top = x - self.width // 2, y - self.height // 2
+        right, bottom = left + self.width, top + self.height
+        visible = (right > -offset.x) & (left < WINDOW_WIDTH - offset.x) & (bottom > -offset.y) & (top < WINDOW_HEIGHT - offset.y)
+        surf = self.surf
+        surface.blits([(surf, (x + offset.x, y + offset.y)) for x, y in zip(left[visible].tolist(), top[visible].tolist())], False)
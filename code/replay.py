@@ -0,0 +1,139 @@
+from settings import *
+from array import array
+import os
+import struct
+import sys
+import zlib
+
+# Recorded games. A game steps by FIXED_DT and takes every random choice from its seeded rng, so it is fully
+# decided by its seed and by what the controller answered each time the game asked. A replay stores just that,
+# and playing it back with ReplayController goes through the same game again, step for step.
+#
+# File layout: a header of b'RPLY', the format version (uint16), the seed (uint64), FIXED_DT (double) and the
+# number of steps (uint32), then, zlib compressed, the three answers in the order they were asked for:
+# movement (x, y per call), aim (x, y per call) and firing (one byte per call). Each stream is a typecode,
+# a count and little-endian values. Vectors are stored as int8 (movement) or int16 (aim) when every value is a
+# whole number in range, which keyboard and mouse input always is, and as doubles otherwise (the bot), so
+# values come back exactly as they were recorded. An hour of keyboard and mouse play takes a few hundred KB.
+#
+# Replays only play back the same way on the same version of the game with the same settings.
+
+MAGIC = b'RPLY'
+REPLAY_VERSION = 1
+HEADER = struct.Struct('<4sHQdI')
+STREAM_HEADER = struct.Struct('<cI')
+
+# The seed and the input of one game
+class Replay:
+    def __init__(self, seed, dt = FIXED_DT, steps = 0, movement = None, aim = None, firing = None):
+        self.seed = seed
+        self.dt = dt
+        self.steps = steps
+        self.movement = movement if movement is not None else []
+        self.aim = aim if aim is not None else []
+        self.firing = firing if firing is not None else []
+
+    # The replay is packed before anything is written, and written through a temporary file like snapshots
+    # (see snapshot.py), so a failed save never leaves a broken replay behind
+    def save(self, path):
+        streams = [
+            pack_vectors(self.movement, 'b', -128, 127),
+            pack_vectors(self.aim, 'h', -32768, 32767),
+            pack_values(array('B', self.firing)),
+        ]
+        data = HEADER.pack(MAGIC, REPLAY_VERSION, self.seed, self.dt, self.steps) + zlib.compress(b''.join(streams))
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+def load_replay(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    magic, version, seed, dt, steps = HEADER.unpack_from(data)
+    if magic != MAGIC or version != REPLAY_VERSION:
+        raise ValueError(f'{path} is not a replay this version of the game can play')
+    body = zlib.decompress(data[HEADER.size:])
+    movement, offset = unpack_values(body, 0)
+    aim, offset = unpack_values(body, offset)
+    firing, offset = unpack_values(body, offset)
+    return Replay(seed, dt, steps, pairs(movement), pairs(aim), [bool(value) for value in firing])
+
+# x, y pairs as one flat array, of whole numbers when they all fit typecode, otherwise of doubles
+def pack_vectors(vectors, typecode, low, high):
+    values = [value for vector in vectors for value in vector]
+    if not all(value == int(value) and low <= value <= high for value in values):
+        typecode = 'd'
+    return pack_values(array(typecode, map(int, values) if typecode != 'd' else values))
+
+def pack_values(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return STREAM_HEADER.pack(values.typecode.encode(), len(values)) + values.tobytes()
+
+# The array that starts at offset in data, and the offset just after it
+def unpack_values(data, offset):
+    typecode, count = STREAM_HEADER.unpack_from(data, offset)
+    offset += STREAM_HEADER.size
+    values = array(typecode.decode())
+    end = offset + count * values.itemsize
+    values.frombytes(data[offset:end])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values, end
+
+def pairs(values):
+    return [pygame.Vector2(values[index], values[index + 1]) for index in range(0, len(values), 2)]
+
+# Passes another controller's input through and writes down every answer. start() begins the replay of a new game.
+class RecordingController:
+    def __init__(self, controller, seed):
+        self.controller = controller
+        self.start(seed)
+
+    def start(self, seed):
+        self.replay = Replay(seed)
+
+    def reset(self):
+        self.controller.reset()
+
+    def movement(self):
+        movement = self.controller.movement()
+        self.replay.movement.append((movement.x, movement.y))
+        return movement
+
+    def aim(self):
+        aim = self.controller.aim()
+        self.replay.aim.append((aim.x, aim.y))
+        return aim
+
+    def firing(self):
+        firing = bool(self.controller.firing())
+        self.replay.firing.append(firing)
+        return firing
+
+# Gives the game the recorded answers back in order
+class ReplayController:
+    def __init__(self, replay):
+        self.replay = replay
+        self.reset()
+
+    def reset(self):
+        self.movements = iter(self.replay.movement)
+        self.aims = iter(self.replay.aim)
+        self.firings = iter(self.replay.firing)
+
+    def next(self, answers):
+        try:
+            return next(answers)
+        except StopIteration:
+            raise RuntimeError('the replay ran out of input, so the game did not play out as recorded') from None
+
+    def movement(self):
+        return pygame.Vector2(self.next(self.movements))
+
+    def aim(self):
+        return pygame.Vector2(self.next(self.aims))
+
+    def firing(self):
+        return self.next(self.firings)
@@ -5,6 +5,8 @@ from pygame.sprite import RenderUpdates
 from enum import Enum
 from settings import *
 from utils import get_asset_path
+from assets import load_image, load_font, RARELY
+from functools import lru_cache
 
 
 #  definitions for RGB colors used in the game
@@ -15,9 +17,20 @@ DARK_GREEN = (70, 200, 70)
 RED = (150, 50, 50)
 DARK_RED = (200, 70, 70)
 
+WIN_IMAGE_PATH = get_asset_path('images', 'ui', 'you_win.png')
+GAME_OVER_IMAGE_PATH = get_asset_path('images', 'ui', 'game_over.png')
+
+# Queue the win and game over art on an AssetLoader. They are only needed when a game ends, so they load last.
+def preload_screen_images(loader):
+    loader.request(RARELY, load_image, WIN_IMAGE_PATH, (WINDOW_WIDTH, WINDOW_HEIGHT))
+    loader.request(RARELY, load_image, GAME_OVER_IMAGE_PATH)
+
 # creates text surfaces with a specific style by first creating a font object, then rendering the text onto a surface.
+# The font comes from the font registry, and the last TEXT_CACHE_SIZE rendered texts are kept, so showing a
+# screen again reuses its button surfaces. The surfaces are shared, so callers must not draw on them.
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
 def create_surface_with_text(text, font_size, text_rgb, bg_rgb):
-    font = pygame.freetype.SysFont("Courier", font_size, bold=True)
+    font = load_font(font_size, "Courier", bold=True)
     surface, _ = font.render(text=text, fgcolor=text_rgb, bgcolor=bg_rgb)
     return surface.convert_alpha()
 
@@ -88,19 +101,30 @@ class BaseScreen:
     def __init__(self, display_surface, clock):
         self.display_surface = display_surface
         self.clock = clock
-        self.title_font = pygame.font.Font(None, 80)
-        self.text_font = pygame.font.Font(None, 40)
+        self.title_font = load_font(80)
+        self.text_font = load_font(40)
     
-    # Override this in subclasses to draw screen-specific content
+    # Override this in subclasses to draw screen-specific content. It is drawn once each time the screen is shown.
     def _draw_content(self):
         pass
 
     # This runs a loop that handles events like mouse clicks, draws the screen, update the buttons
     # and returns an action when the user clicks on the button. 
+    # Nothing on a screen moves except the buttons, so the content is drawn once and kept as the background.
+    # The loop then sleeps until an event arrives, and only redraws and pushes to the display the buttons
+    # whose hover state changed. An idle menu uses next to no CPU.
     def _game_loop(self, buttons):
+        self._draw_content()
+        background = self.display_surface.copy()
+        for button in buttons:
+            button.update(pygame.mouse.get_pos(), False)
+        buttons.draw(self.display_surface)
+        pygame.display.flip()
+
         while True:
             mouse_up = False
-            for event in pygame.event.get():
+            redraw = False
+            for event in [pygame.event.wait()] + pygame.event.get():
                 # Look at all the events that happened in a frame. If user clicked close the window, 
                 # quit the game.
                 if event.type == pygame.QUIT:
@@ -109,18 +133,26 @@ class BaseScreen:
                 # If the left mouse button was released,set mouse_up to true.
                 if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
                     mouse_up = True
+
+                # The window was uncovered or restored, so all of it has to be shown again
+                if event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                    redraw = True
             
-            # Draw screen-specific content (implemented by subclass)
-            self._draw_content()
-            
-            # update and draw buttons by going through each buttom, and if it was clicked on, get its action.
+            # update the buttons by going through each buttom, and if it was clicked on, get its action.
+            hovered = [button.mouse_over for button in buttons]
             for button in buttons:
                 ui_action = button.update(pygame.mouse.get_pos(), mouse_up)
                 if ui_action is not None:
                     return ui_action
-            # Draw all butotons to display surface and update the display.
-            buttons.draw(self.display_surface)
-            pygame.display.flip()
+
+            # Draw the buttons again only if one of them changed, and update just the area they cover
+            if redraw:
+                self.display_surface.blit(background, (0, 0))
+                buttons.draw(self.display_surface)
+                pygame.display.flip()
+            elif hovered != [button.mouse_over for button in buttons]:
+                buttons.clear(self.display_surface, background)
+                pygame.display.update(buttons.draw(self.display_surface))
             self.clock.tick(60)
 # Initialize the start screen containing the rules and play button.
 class StartScreen(BaseScreen):
@@ -181,8 +213,7 @@ class WinScreen(BaseScreen):
         
         # Load win image. In cas the image is missing, it would render something on its own.
         try:
-            self.win_img = pygame.image.load(get_asset_path('images', 'ui', 'you_win.png')).convert_alpha()
-            self.win_img = pygame.transform.scale(self.win_img, (WINDOW_WIDTH, WINDOW_HEIGHT))
+            self.win_img = load_image(WIN_IMAGE_PATH, (WINDOW_WIDTH, WINDOW_HEIGHT))
             self.has_win_img = True
         except:
             self.has_win_img = False
@@ -236,11 +267,12 @@ class GameOverScreen(BaseScreen):
         
         # Tries to load the game over screen image, but if it's not there, it would render something on its own
         try:
-            self.game_over_img = pygame.image.load(get_asset_path('images', 'ui', 'game_over.png')).convert_alpha()
+            game_over_path = GAME_OVER_IMAGE_PATH
+            self.game_over_img = load_image(game_over_path)
             target_width = int(WINDOW_WIDTH * 0.8)
             aspect_ratio = self.game_over_img.get_height() / self.game_over_img.get_width()
             target_height = int(target_width * aspect_ratio)
-            self.game_over_img = pygame.transform.scale(self.game_over_img, (target_width, target_height))
+            self.game_over_img = load_image(game_over_path, (target_width, target_height))
             self.has_game_over_img = True
         except:
             self.has_game_over_img = False
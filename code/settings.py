@@ -7,6 +7,12 @@ from os import walk
 WINDOW_WIDTH, WINDOW_HEIGHT = 1280,720
 TILE_SIZE = 64
 
+# Map settings
+# Ground tiles are baked into square chunks of this many tiles per side
+GROUND_CHUNK_SIZE = 16
+# Sprites this many pixels outside the window are still drawn
+DRAW_MARGIN = 64
+
 # Constants used in the game
 # Player settings
 PLAYER_SPEED = 500
@@ -21,16 +27,42 @@ GUN_DISTANCE = 140
 GUN_SIZE = 150
 GUN_COOLDOWN = 100
 BULLET_OFFSET = 50
+# Rotated images (the gun) are cached in this many steps per full turn
+ROTATION_STEPS = 360
 
 # Bullet settings
 BULLET_SIZE = 25
 BULLET_SPEED = 1200
 BULLET_LIFETIME = 1000
+# Bullets fired at once and the angle in degrees between them, for spread shots
+BULLETS_PER_SHOT = 1
+BULLET_SPREAD = 10
+# Keep all bullets in numpy arrays instead of one sprite each (see projectiles.py). Ignored without numpy.
+BATCHED_BULLETS = True
+BULLET_CAPACITY = 64
 
 # Enemy settings
 ENEMY_ANIMATION_SPEED = 6
 ENEMY_HITBOX_INFLATE = (-90, -90)
 ENEMY_DEATH_DURATION = 400
+# Cell size of the grid that enemies are sorted into each frame for bullet hits
+ENEMY_GRID_CELL_SIZE = 128
+# Move all enemies in one numpy batch (see horde.py). Ignored when numpy is not installed.
+BATCHED_ENEMIES = True
+# Enemies the batch has room for before its arrays are doubled
+ENEMY_ENGINE_CAPACITY = 256
+# Enemies more than ENEMY_LOD_MARGIN pixels outside the window are updated less often and not animated (see
+# lod.py): at most every ENEMY_LOD_INTERVAL ms, in steps of at most ENEMY_LOD_MAX_STEP seconds, and within
+# ENEMY_LOD_BUDGET ms per frame when playing
+ENEMY_LOD = True
+ENEMY_LOD_MARGIN = 256
+ENEMY_LOD_INTERVAL = 100
+ENEMY_LOD_MAX_STEP = 0.1
+ENEMY_LOD_BUDGET = 2
+# Enemies follow a shared flow field around obstacles instead of walking straight at the player (see flowfield.py)
+ENEMY_PATHFINDING = True
+# A map cell is blocked for pathfinding when an obstacle overlaps a square this big in its middle
+FLOW_FIELD_CLEARANCE = 32
 
 ENEMY_NORMAL_SPEED = 200
 ENEMY_FAST_SPEED = 350
@@ -46,11 +78,34 @@ ENEMIES_INCREMENT_PER_WAVE = 5
 INITIAL_SPAWN_INTERVAL = 2000
 MIN_SPAWN_INTERVAL = 500
 SPAWN_INTERVAL_DECREASE = 100
+# Enemies made ahead of time when a game starts: as many as there are in the wave this many waves after the first
+ENEMY_POOL_WAVES = 4
 
 # UI settings
 HEART_SCALE_FACTOR = 0.25
 HEART_ORIGINAL_WIDTH = 880
 HEART_ORIGINAL_HEIGHT = 152
+# Rendered menu texts kept for reuse
+TEXT_CACHE_SIZE = 64
 
 # Home settings
-HOME_SIZE = (384, 384)
\ No newline at end of file
+HOME_SIZE = (384, 384)
+
+# Game loop settings. The game always advances in steps of FIXED_DT seconds, however fast frames are drawn.
+FIXED_DT = 1 / 60
+# Frames drawn per second at most (0 for no limit)
+FRAME_CAP = 144
+# Longest frame time caught up on, in seconds. After a longer stall the game slows down instead of running many steps.
+MAX_FRAME_TIME = 0.25
+
+# Headless simulation settings
+HEADLESS_MAX_TIME = 600000
+# Game time between checkpoint snapshots (python main.py --checkpoint PATH), in milliseconds
+CHECKPOINT_INTERVAL = 60000
+BOT_FIRE_RANGE = 600
+BOT_DETOUR_STEPS = 30
+
+# Profiler settings
+PROFILER_WINDOW = 600
+PROFILER_OVERLAY_REFRESH = 0.25
+PROFILER_OVERLAY_WIDTH = 320
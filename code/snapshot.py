@@ -0,0 +1,240 @@
+from settings import *
+from sprites import Home
+from array import array
+import os
+import struct
+import sys
+
+# Snapshots of a running game: everything that decides how it goes on from here, so a long run can be
+# checkpointed and picked up again after a crash, and a load test can start straight from a late wave.
+# save_snapshot turns a game into bytes and restore_snapshot puts a game back into that state. A restored game
+# steps on exactly like the game the snapshot was taken from would have.
+#
+# What is saved: the seed, steps and game time, the rng, the wave and spawn counters, the gun, spawn and damage
+# timers, the statistics, the player (position, animation, health), the gun direction, the home, the health
+# packs still on the map, every enemy (kind, type, position, animation, death time, time since its last
+# scheduled update) in update order, and every bullet (position, velocity, spawn time) in firing order.
+# The map, images and pools are not: they come from the game's own setup. Neither is the controller, so a
+# restored game played by the bot may make other choices than the original would have.
+#
+# File layout: b'SNAP' and the format version, then fixed size little-endian records: the game, the rng
+# (its whole Mersenne Twister state), the player and gun, the home, then counted lists of health packs, enemy
+# kinds (folder names, which enemies refer to by position in this list), enemies and bullets. It is not
+# compressed: an enemy takes 50 bytes, a game at wave 20 about 8 KB, and packing one takes a fraction of a
+# millisecond. Snapshots only restore on the same version of the game.
+
+MAGIC = b'SNAP'
+SNAPSHOT_VERSION = 2
+ENEMY_TYPES = ('normal', 'fast', 'tank')
+PLAYER_STATES = ('left', 'right', 'up', 'down')
+
+# magic, version, seed, steps, game time, wave number, enemies killed, enemies per wave, spawn interval,
+# spawn time, shoot time, can shoot, total kills, damage taken, enemy scheduler turn
+GAME = struct.Struct('<4sHQIdIIIqqq?IIQ')
+# rng version, whether it holds a gaussian, the gaussian, and the number of state words that follow
+RNG = struct.Struct('<B?dI')
+# hitbox x, y, state, frame index, direction x, y, health, can take damage, damage time, collision start time,
+# is colliding, gun direction x, y
+PLAYER = struct.Struct('<iiBdddb?qq?dd')
+# whether there is a home, its center
+HOME = struct.Struct('<?ii')
+COUNT = struct.Struct('<I')
+# topleft
+HEALTH_PACK = struct.Struct('<ii')
+# length of an enemy kind's folder name, followed by the name in UTF-8
+NAME = struct.Struct('<B')
+# kind (index into the snapshot's kinds), type, hitbox x, y, frame index, direction x, y, death time, lod time
+ENEMY = struct.Struct('<BBiidddqd')
+# whether the bullets are batched (see projectiles.py), and how many there are
+BULLETS = struct.Struct('<?I')
+# center x, y, velocity x, y (batched) or direction x, y (sprites), spawn time
+BULLET = struct.Struct('<ddddd')
+
+def save_snapshot(game):
+    player, gun, home = game.player, game.gun, game.home_sprite.sprite
+    version, words, gauss = game.rng.getstate()
+    # Enemies know their frames but not their kind, so kinds are found by their frames list. Only the kinds of
+    # the enemies there are now are listed, in the order they first come up.
+    folder_of = {id(frames): folder for folder, (frames, _, _) in game.enemy_kinds.items()}
+    enemies = game.enemy_sprites.sprites()
+    folders = list(dict.fromkeys(folder_of[id(enemy.frames)] for enemy in enemies))
+    kinds = {id(game.enemy_kinds[folder][0]): index for index, folder in enumerate(folders)}
+
+    parts = [
+        GAME.pack(MAGIC, SNAPSHOT_VERSION, game.seed, game.steps, game.sim_clock.time, game.wave_number,
+            game.enemies_killed, game.enemies_per_wave, game.spawn_interval, game.spawn_time, game.shoot_time,
+            game.can_shoot, game.total_kills, game.damage_taken, game.enemy_scheduler.turn),
+        RNG.pack(version, gauss is not None, gauss or 0, len(words)),
+        little_endian(array('I', words)).tobytes(),
+        PLAYER.pack(player.hitbox_rect.x, player.hitbox_rect.y, PLAYER_STATES.index(player.state), player.frame_index,
+            player.direction.x, player.direction.y, player.health, player.can_take_damage, player.damage_time,
+            player.collision_start_time, player.is_colliding, gun.player_direction.x, gun.player_direction.y),
+        HOME.pack(home is not None, *(home.rect.center if home else (0, 0))),
+    ]
+
+    health_packs = game.health_pack_sprites.sprites()
+    parts.append(COUNT.pack(len(health_packs)))
+    parts.extend(HEALTH_PACK.pack(*health_pack.rect.topleft) for health_pack in health_packs)
+
+    parts.append(COUNT.pack(len(folders)))
+    for folder in folders:
+        name = folder.encode()
+        parts.append(NAME.pack(len(name)) + name)
+
+    parts.append(COUNT.pack(len(enemies)))
+    parts.extend(ENEMY.pack(kinds[id(enemy.frames)], ENEMY_TYPES.index(enemy.enemy_type), enemy.hitbox_rect.x,
+        enemy.hitbox_rect.y, enemy.frame_index, enemy.direction.x, enemy.direction.y, enemy.death_time, enemy.lod_time)
+        for enemy in enemies)
+
+    projectiles = game.projectiles
+    if projectiles:
+        count = projectiles.count
+        bullets = zip(projectiles.x[:count].tolist(), projectiles.y[:count].tolist(), projectiles.velocity_x[:count].tolist(),
+            projectiles.velocity_y[:count].tolist(), projectiles.spawn_time[:count].tolist())
+    else:
+        count = len(game.bullet_sprites)
+        bullets = ((*bullet.rect.center, bullet.direction.x, bullet.direction.y, bullet.spawn_time) for bullet in game.bullet_sprites)
+    parts.append(BULLETS.pack(bool(projectiles), count))
+    parts.extend(BULLET.pack(*bullet) for bullet in bullets)
+    return b''.join(parts)
+
+# Start a new game in game from its setup and bring it to the state in data
+def restore_snapshot(game, data):
+    (magic, version, seed, steps, time, wave_number, enemies_killed, enemies_per_wave, spawn_interval, spawn_time,
+        shoot_time, can_shoot, total_kills, damage_taken, turn) = GAME.unpack_from(data)
+    if magic != MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError('not a snapshot this version of the game can restore')
+    offset = GAME.size
+
+    game.reset_game(seed)
+    game.steps = steps
+    game.sim_clock.time = time
+    game.wave_number = wave_number
+    game.enemies_killed = enemies_killed
+    game.enemies_per_wave = enemies_per_wave
+    # Timers are not saved but set again from the times they count from, on the restored clock
+    game.spawn_interval = spawn_interval
+    game.schedule_spawn(spawn_time)
+    game.shoot_time, game.can_shoot = shoot_time, can_shoot
+    if not can_shoot:
+        game.start_gun_cooldown(shoot_time)
+    game.total_kills = total_kills
+    game.damage_taken = damage_taken
+    game.enemy_scheduler.turn = turn
+
+    rng_version, has_gauss, gauss, word_count = RNG.unpack_from(data, offset)
+    offset += RNG.size
+    words = array('I')
+    words.frombytes(data[offset:offset + word_count * words.itemsize])
+    offset += word_count * words.itemsize
+    game.rng.setstate((rng_version, tuple(little_endian(words)), gauss if has_gauss else None))
+
+    (x, y, state, frame_index, direction_x, direction_y, health, can_take_damage, damage_time, collision_start_time,
+        is_colliding, gun_x, gun_y) = PLAYER.unpack_from(data, offset)
+    offset += PLAYER.size
+    player, gun = game.player, game.gun
+    player.hitbox_rect.topleft = (x, y)
+    player.rect.center = player.hitbox_rect.center
+    player.state, player.frame_index = PLAYER_STATES[state], frame_index
+    player.direction = pygame.Vector2(direction_x, direction_y)
+    # With the direction and frame set, animating by no time only picks the matching image and mask
+    player.animate(0)
+    player.health, player.can_take_damage, player.damage_time = health, can_take_damage, damage_time
+    if not can_take_damage:
+        player.start_invincibility(damage_time)
+    player.collision_start_time, player.is_colliding = collision_start_time, is_colliding
+    gun.player_direction = pygame.Vector2(gun_x, gun_y)
+    gun.rotate_gun()
+    gun.rect.center = player.rect.center + gun.player_direction * gun.distance
+
+    # Setup places the home from the same seed, so it is normally where it was already
+    has_home, home_x, home_y = HOME.unpack_from(data, offset)
+    offset += HOME.size
+    home = game.home_sprite.sprite
+    if home and (not has_home or home.rect.center != (home_x, home_y)):
+        home.kill()
+        home = None
+    if has_home and not home:
+        Home((home_x, home_y), (game.all_sprites, game.home_sprite))
+
+    (count,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    kept = {topleft for topleft in HEALTH_PACK.iter_unpack(data[offset:offset + count * HEALTH_PACK.size])}
+    offset += count * HEALTH_PACK.size
+    for health_pack in game.health_pack_sprites.sprites():
+        if health_pack.rect.topleft not in kept:
+            health_pack.kill()
+
+    (count,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    folders = []
+    for _ in range(count):
+        (length,) = NAME.unpack_from(data, offset)
+        offset += NAME.size
+        folders.append(data[offset:offset + length].decode())
+        offset += length
+    missing = set(folders) - set(game.enemy_folders)
+    if missing:
+        raise ValueError(f'the snapshot has enemy kinds this game does not: {", ".join(sorted(missing))}')
+
+    (count,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    for kind, enemy_type, x, y, frame_index, direction_x, direction_y, death_time, lod_time in ENEMY.iter_unpack(data[offset:offset + count * ENEMY.size]):
+        enemy = game.add_enemy((0, 0), folders[kind], ENEMY_TYPES[enemy_type])
+        enemy.place((x, y))
+        enemy.frame_index = frame_index
+        enemy.animate(0)
+        enemy.direction.update(direction_x, direction_y)
+        enemy.lod_time = lod_time
+        if death_time:
+            enemy.health = 0
+            enemy.die(death_time)
+    offset += count * ENEMY.size
+
+    batched, count = BULLETS.unpack_from(data, offset)
+    offset += BULLETS.size
+    bullets = list(BULLET.iter_unpack(data[offset:offset + count * BULLET.size]))
+    # Bullets saved by a game with the other kind of bullets are converted, which may move them by a rounding error
+    if game.projectiles:
+        scale = 1 if batched else BULLET_SPEED
+        restore_projectiles(game.projectiles, [(x, y, a * scale, b * scale, spawned) for x, y, a, b, spawned in bullets])
+    else:
+        scale = BULLET_SPEED if batched else 1
+        for x, y, a, b, spawned in bullets:
+            game.fire_bullet((x, y), pygame.Vector2(a, b) / scale)
+        for bullet, (*_, spawned) in zip(game.bullet_sprites, bullets):
+            bullet.start_lifetime(spawned)
+
+def restore_projectiles(projectiles, bullets):
+    while len(projectiles.x) < len(bullets):
+        projectiles.grow()
+    count = projectiles.count = len(bullets)
+    if not count:
+        return
+    x, y, velocity_x, velocity_y, spawn_time = zip(*bullets)
+    projectiles.x[:count] = projectiles.previous_x[:count] = x
+    projectiles.y[:count] = projectiles.previous_y[:count] = y
+    projectiles.velocity_x[:count] = velocity_x
+    projectiles.velocity_y[:count] = velocity_y
+    projectiles.spawn_time[:count] = spawn_time
+    for spawned in spawn_time:
+        projectiles.schedule_expiry(spawned)
+
+# Values are stored little-endian, as in replay.py
+def little_endian(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+# Write a snapshot through a temporary file, so a crash while saving leaves the last complete one in place.
+# It is packed first, so a game that cannot be saved does not leave a temporary file either.
+def write_snapshot(game, path):
+    data = save_snapshot(game)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+def read_snapshot(game, path):
+    with open(path, 'rb') as file:
+        restore_snapshot(game, file.read())
@@ -0,0 +1,42 @@
+from settings import *
+
+# Uniform grid over the map used to find the sprites near a rect without scanning all of them.
+# Each sprite is stored (by its index in self.sprites) in every cell its rect touches, so a query only
+# looks at the few cells the query rect covers. Indices keep the order the sprites were added in.
+class SpatialGrid:
+    def __init__(self, sprites = (), cell_size = TILE_SIZE):
+        self.cell_size = cell_size
+        self.sprites = []
+        self.cells = {}
+        for sprite in sprites:
+            self.insert(sprite)
+
+    # Yield the (column, row) of every cell that rect overlaps. A rect with a negative width or height
+    # (some enemy hitboxes) spans from right to left or bottom to top, the same as pygame's colliderect sees it.
+    def cells_for(self, rect):
+        x1, x2 = sorted((rect.left, rect.right))
+        y1, y2 = sorted((rect.top, rect.bottom))
+        left = x1 // self.cell_size
+        top = y1 // self.cell_size
+        right = max(x2 - 1, x1) // self.cell_size
+        bottom = max(y2 - 1, y1) // self.cell_size
+        for row in range(top, bottom + 1):
+            for column in range(left, right + 1):
+                yield column, row
+
+    def insert(self, sprite):
+        index = len(self.sprites)
+        self.sprites.append(sprite)
+        for cell in self.cells_for(sprite.rect):
+            self.cells.setdefault(cell, []).append(index)
+
+    # Return the sorted indices of the sprites that share a cell with rect, skipping indices below start
+    def query(self, rect, start = 0):
+        found = set()
+        for cell in self.cells_for(rect):
+            found.update(self.cells.get(cell, ()))
+        return sorted(index for index in found if index >= start)
+
+    # Return the sprites whose rect overlaps rect, in the order they were added
+    def colliding(self, rect):
+        return [self.sprites[index] for index in self.query(rect) if self.sprites[index].rect.colliderect(rect)]
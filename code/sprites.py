@@ -1,19 +1,14 @@
 from settings import * 
 from math import atan2, degrees
 from utils import get_asset_path, handle_collision
-
-# Sets up sprite with an image and position,
-#  marks it as a ground layer sprite for rendering order
-class GroundSprite(pygame.sprite.Sprite):
-    def __init__(self, pos, surf, groups):
-        super().__init__(groups)
-        self.image = surf
-        self.rect = self.image.get_rect(topleft = pos)
-        self.ground = True
+from assets import load_image, load_rotations
+from timing import get_ticks, schedule
 
 # Sprite class for objects that block movement (trees, rocks, map borders)
 # These sprites have collision detection but could be invisible
 class CollisionSprite(pygame.sprite.Sprite):
+    static = True
+
     def __init__(self, pos, surf, groups):
         super().__init__(groups)
         self.image = surf
@@ -31,30 +26,28 @@ class Gun(pygame.sprite.Sprite):
         # sprite setup 
         super().__init__(groups)
 
-        lasergun_original = pygame.image.load(get_asset_path('images', 'gun', 'lasergun.png')).convert_alpha()
-        # Scale down the image of laser gun
+        # Scale down the image of laser gun. Its rotations are shared by every game.
         lasergun_size = GUN_SIZE
-        self.gun_surf = pygame.transform.scale(lasergun_original, (lasergun_size, lasergun_size))
+        self.gun_surf = load_image(get_asset_path('images', 'gun', 'lasergun.png'), (lasergun_size, lasergun_size))
+        self.rotations = load_rotations(get_asset_path('images', 'gun', 'lasergun.png'), (lasergun_size, lasergun_size))
 
         self.image = self.gun_surf
         self.rect = self.image.get_rect(center = self.player.rect.center + self.player_direction * self.distance)
     
-    # Calculate the direction from player to the mouse cursor
-    # Uses screen center as player position since the camera follows the player
+    # Calculate the direction from player to the mouse cursor (or wherever the player's controller aims)
+    # The mouse controller uses screen center as player position since the camera follows the player
     def get_direction(self):
-        mouse_pos = pygame.Vector2(pygame.mouse.get_pos())
-        player_pos = pygame.Vector2(WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2)
-        self.player_direction = (mouse_pos - player_pos).normalize()
+        self.player_direction = self.player.controller.aim().normalize()
 
     # rotate gun image to point in the direction of the mouse cursor.
     # flips gun vertically when pointing left
+    # The rotated images come from the rotation cache, to the nearest of ROTATION_STEPS angles.
     def rotate_gun(self):
         angle = degrees(atan2(self.player_direction.x, self.player_direction.y)) - 90
         if self.player_direction.x > 0:
-            self.image = pygame.transform.rotozoom(self.gun_surf, angle, 1)
+            self.image = self.rotations.get(angle)
         else:
-            self.image = pygame.transform.rotozoom(self.gun_surf, abs(angle), 1)
-            self.image = pygame.transform.flip(self.image, False, True)
+            self.image = self.rotations.get(abs(angle), True)
     
     # update the position and rotation of gun (for every frame)
     def update(self, _):
@@ -62,42 +55,93 @@ class Gun(pygame.sprite.Sprite):
         self.rotate_gun()
         self.rect.center = self.player.rect.center + self.player_direction * self.distance
 # bullet is fired by the player's gun. Travels in a straight line and
-# automatically kills itself after 1 sec
+# automatically kills itself after 1 sec, by a timer on the game clock
+# Bullets are pooled (see pool.py): kill() deactivates the bullet and gives it back to its pool,
+# and activate() sends it out again from a new position.
 class Bullet(pygame.sprite.Sprite):
-    def __init__(self, surf, pos, direction, groups):
-        super().__init__(groups)
+    def __init__(self, surf, mask, pos, direction, groups, pool = None):
+        super().__init__()
         self.image = surf 
-        self.rect = self.image.get_rect(center = pos)
-        self.spawn_time = pygame.time.get_ticks()
+        self.mask = mask
+        self.rect = self.image.get_rect()
         self.lifetime = BULLET_LIFETIME
+        self.speed = BULLET_SPEED
+        self.pool = pool
+        self.expiry = None
+        self.activate(pos, direction, groups)
 
+    def activate(self, pos, direction, groups):
+        self.rect.center = pos
         self.direction = direction 
-        self.speed = BULLET_SPEED
+        self.active = True
+        self.add(groups)
+        self.start_lifetime(get_ticks())
+
+    # The bullet disappears lifetime milliseconds after spawn_time
+    def start_lifetime(self, spawn_time):
+        if self.expiry:
+            self.expiry.cancel()
+        self.spawn_time = spawn_time
+        self.expiry = schedule(spawn_time + self.lifetime, self.kill)
+
+    def deactivate(self):
+        if self.active:
+            self.active = False
+            self.expiry.cancel()
+            super().kill()
+            if self.pool:
+                self.pool.release(self)
+
+    def kill(self):
+        self.deactivate()
     
     def update(self, dt):
         self.rect.center += self.direction * self.speed * dt
 
-        if pygame.time.get_ticks() - self.spawn_time >= self.lifetime:
-            self.kill()
-
 # Enemy sprite. chase the player
  # while avoiding collision with obstacles.
+# Enemies are pooled like bullets. The player, obstacles, engine and flow field stay the same for a whole
+# game, everything else is set again by activate().
 class Enemy(pygame.sprite.Sprite):
-    def __init__(self, pos, frames, groups, player, collision_sprites, enemy_type='normal'):
-        super().__init__(groups)
+    # Updated by the EnemyScheduler (lod.py) instead of by AllSprites
+    scheduled = True
+
+    def __init__(self, pos, frames, masks, death_surf, groups, player, collision_grid, enemy_type='normal', engine=None, flow_field=None, pool=None):
+        super().__init__()
         self.player = player
+        self.collision_grid = collision_grid
+        self.flow_field = flow_field
+        self.pool = pool
+        self.animation_speed = ENEMY_ANIMATION_SPEED
+        self.death_duration = ENEMY_DEATH_DURATION
+
+        # With an EnemyEngine, the engine moves this enemy together with all the others
+        self.engine = engine
+
+        # rect 
+        self.rect = pygame.Rect(0, 0, 0, 0)
+        self.hitbox_rect = pygame.Rect(0, 0, 0, 0)
+        self.direction = pygame.Vector2()
+        # removes the enemy once its death animation is over
+        self.death_timer = None
+        self.activate(pos, frames, masks, death_surf, groups, enemy_type)
+
+    def activate(self, pos, frames, masks, death_surf, groups, enemy_type='normal'):
         self.enemy_type = enemy_type
 
-        # image 
+        # image, with a precomputed collision mask for each frame
         self.frames, self.frame_index = frames, 0 
+        self.masks = masks
+        self.death_surf = death_surf
         self.image = self.frames[self.frame_index]
-        self.animation_speed = ENEMY_ANIMATION_SPEED
+        self.mask = self.masks[self.frame_index]
 
         # rect 
-        self.rect = self.image.get_rect(center = pos)
-        self.hitbox_rect = self.rect.inflate(ENEMY_HITBOX_INFLATE)
-        self.collision_sprites = collision_sprites
-        self.direction = pygame.Vector2()
+        self.rect.size = self.image.get_size()
+        self.rect.center = pos
+        self.hitbox_rect.update(self.rect)
+        self.hitbox_rect.inflate_ip(ENEMY_HITBOX_INFLATE)
+        self.direction.update(0, 0)
 
         # There are three different enemy types, they move with different speed and can do different amounts of damage on player.
         if enemy_type == 'fast':
@@ -115,20 +159,50 @@ class Enemy(pygame.sprite.Sprite):
 
         # timer 
         self.death_time = 0
-        self.death_duration = ENEMY_DEATH_DURATION
+        # seconds since the scheduler last updated this enemy
+        self.lod_time = 0
+
+        self.active = True
+        self.add(groups)
+        if self.engine:
+            self.engine.add(self)
+
+    def deactivate(self):
+        if self.active:
+            self.active = False
+            if self.death_timer:
+                self.death_timer.cancel()
+            if self.engine:
+                self.engine.remove(self)
+            super().kill()
+            if self.pool:
+                self.pool.release(self)
+
+    def kill(self):
+        self.deactivate()
+
+    # Put the enemy's hitbox at topleft, for a game restored from a snapshot
+    def place(self, topleft):
+        self.hitbox_rect.topleft = topleft
+        self.rect.center = self.hitbox_rect.center
+        if self.engine:
+            self.engine.place(self)
     
     def animate(self, dt):
         self.frame_index += self.animation_speed * dt
-        self.image = self.frames[int(self.frame_index) % len(self.frames)]
+        index = int(self.frame_index) % len(self.frames)
+        self.image = self.frames[index]
+        self.mask = self.masks[index]
 
     # Calculate direction toward player and move the enemy, handling collisions with obstacles.
+    # With a flow field the enemy walks toward the next cell on the way around obstacles instead.
     # Checks for zero-length vector to prevent errors when enemy is on top of player.
     
     def move(self, dt):
         # get direction 
-        player_pos = pygame.Vector2(self.player.rect.center)
+        target_pos = pygame.Vector2(self.flow_field.target(self.rect.center) if self.flow_field else self.player.rect.center)
         enemy_pos = pygame.Vector2(self.rect.center)
-        direction_vector = player_pos - enemy_pos
+        direction_vector = target_pos - enemy_pos
         if direction_vector.length() > 0:  # ADD THIS CHECK
             self.direction = direction_vector.normalize()
         else:
@@ -144,42 +218,60 @@ class Enemy(pygame.sprite.Sprite):
     # Handle enemy collision with obstacles by preventing overlap
     # Adjusts hitbox position based on collision direction (horizontal or vertical)
     def collision(self, direction):
-        handle_collision(self.hitbox_rect, self.collision_sprites, direction, self.direction)
+        handle_collision(self.hitbox_rect, self.collision_grid, direction, self.direction)
 
     def destroy(self):
         self.health -= 1
         if self.health <= 0:
-            self.death_time = pygame.time.get_ticks()
-            surf = pygame.mask.from_surface(self.frames[0]).to_surface()
-            surf.set_colorkey('black')
-            self.image = surf
-    
-    # Remove the enemy sprite after the death animation duration has elapsed.
-    def death_timer(self):
-        if pygame.time.get_ticks() - self.death_time >= self.death_duration:
-            self.kill()
+            self.die(get_ticks())
+
+    # Show the white silhouette from death_time on, and remove the enemy sprite after the death animation duration.
+    # An enemy hit again while dying starts its death animation over.
+    def die(self, death_time):
+        self.death_time = death_time
+        # The silhouette is made from the first frame, so its mask is the first frame's mask
+        self.image = self.death_surf
+        self.mask = self.masks[0]
+        if self.engine:
+            self.engine.stop(self)
+        if self.death_timer:
+            self.death_timer.cancel()
+        self.death_timer = schedule(death_time + self.death_duration, self.kill)
+
    
-   # Update enemy behavior each frame. If alive, move and animate. If dead, run death timer.
+   # Update enemy behavior each frame. If alive, move and animate. A dead enemy waits for its death timer.
+    # With an engine, the move happens in the engine's next batch.
     def update(self, dt):
         if self.death_time == 0:
-            self.move(dt)
+            self.move_by(dt)
             self.animate(dt)
+
+    # Cheaper update for enemies far outside the window: move, but don't animate
+    def update_far(self, dt):
+        if self.death_time == 0:
+            self.move_by(dt)
+
+    def move_by(self, dt):
+        if self.engine:
+            self.engine.move(self, dt)
         else:
-            self.death_timer()
+            self.move(dt)
     
  #  home sprite. Loads and scales the home image to appropriate size.
 class Home(pygame.sprite.Sprite):
+    static = True
+
     def __init__(self, pos, groups):
         super().__init__(groups)
-        home_original = pygame.image.load(get_asset_path('images', 'home', 'home.png')).convert_alpha()
-        
         home_size = HOME_SIZE
-        self.image = pygame.transform.scale(home_original, home_size)
+        self.image = load_image(get_asset_path('images', 'home', 'home.png'), home_size)
         self.rect = self.image.get_rect(center=pos)
 
  # Health sprite that restores one heart to the player when collected.
     # Placed throughout the map for players to find and use.
 class HealthPack(pygame.sprite.Sprite):
+    static = True
+
     def __init__(self, pos, surf, groups):
         super().__init__(groups)
         self.image = surf
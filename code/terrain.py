@@ -0,0 +1,35 @@
+from settings import *
+
+# Static ground renderer. The ground tiles never move, so instead of keeping one sprite per tile
+# they are baked once into large chunk surfaces, and only the chunks that overlap the camera are drawn.
+class Terrain:
+    def __init__(self, tiles, chunk_size = GROUND_CHUNK_SIZE):
+        self.chunk_pixels = chunk_size * TILE_SIZE
+        self.chunks = {}
+        # Size of the ground in pixels
+        self.size = (0, 0)
+
+        # Group the tiles by the chunk they fall in and paint them onto that chunk's surface.
+        # The display is cleared to black every frame, so an opaque black chunk looks the same
+        # as the separate tiles did and is much cheaper to blit.
+        for x, y, surf in tiles:
+            key = (x // chunk_size, y // chunk_size)
+            if key not in self.chunks:
+                self.chunks[key] = pygame.Surface((self.chunk_pixels, self.chunk_pixels)).convert()
+            local_pos = ((x % chunk_size) * TILE_SIZE, (y % chunk_size) * TILE_SIZE)
+            self.chunks[key].blit(surf, local_pos)
+            self.size = (max(self.size[0], (x + 1) * TILE_SIZE), max(self.size[1], (y + 1) * TILE_SIZE))
+
+    # Blit every chunk that is at least partly inside the window. The camera offset is the same one
+    # AllSprites uses, so world position + offset gives the screen position.
+    def draw(self, surface, offset):
+        left = int(-offset.x // self.chunk_pixels)
+        top = int(-offset.y // self.chunk_pixels)
+        right = int((-offset.x + WINDOW_WIDTH) // self.chunk_pixels)
+        bottom = int((-offset.y + WINDOW_HEIGHT) // self.chunk_pixels)
+
+        for cy in range(top, bottom + 1):
+            for cx in range(left, right + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is not None:
+                    surface.blit(chunk, (cx * self.chunk_pixels + offset.x, cy * self.chunk_pixels + offset.y))
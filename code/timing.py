@@ -0,0 +1,69 @@
+from settings import *
+from heapq import heappush, heappop
+from itertools import count
+
+# Game time in milliseconds. Sprites and timers read it through get_ticks() instead of pygame.time.get_ticks(),
+# so the game can run on a SimulationClock that only moves when the simulation steps. With no clock set,
+# this is pygame's wall clock.
+_active_clock = None
+
+# Clock that advances by the dt of each simulation step, however long the step took to run.
+# Advancing it runs the timers that have come due (see Timers), before anything else in the step.
+class SimulationClock:
+    def __init__(self):
+        self.time = 0.0
+        self.timers = Timers()
+
+    def advance(self, dt):
+        self.time += dt * 1000
+        self.timers.run(self.get_ticks())
+
+    def get_ticks(self):
+        return int(self.time)
+
+# Make every get_ticks() call read clock. Passing None goes back to the wall clock.
+def use_clock(clock):
+    global _active_clock
+    _active_clock = clock
+
+def get_ticks():
+    if _active_clock is None:
+        return pygame.time.get_ticks()
+    return _active_clock.get_ticks()
+
+# Call callback once the game time reaches time (in milliseconds, like get_ticks). Returns the Timer, to cancel it.
+# Timers run on the SimulationClock in use, and go away with it when a new game starts on a new clock.
+def schedule(time, callback):
+    return _active_clock.timers.add(time, callback)
+
+# Things to do at set game times, such as a bullet running out or the gun cooling down, kept in a min-heap by
+# time. Each step only looks at the timers that are due, so the cost of a step is the number of timers that
+# fire, not the number of objects waiting on one. Timers due at the same time run in the order they were
+# added. A cancelled timer stays in the heap and is skipped when its time comes.
+class Timers:
+    def __init__(self):
+        self.heap = []
+        self.order = count()
+
+    def add(self, time, callback):
+        timer = Timer(callback)
+        heappush(self.heap, (time, next(self.order), timer))
+        return timer
+
+    # Run every timer due at now, including ones added by the callbacks that are already due
+    def run(self, now):
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            timer = heappop(heap)[2]
+            callback, timer.callback = timer.callback, None
+            if callback:
+                callback()
+
+class Timer:
+    __slots__ = ('callback',)
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def cancel(self):
+        self.callback = None
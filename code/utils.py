@@ -9,16 +9,27 @@ def get_asset_path(*path_parts):
 
 # Handle collision between a moving rectangle and static collision sprites
 # This function is used by both Player and Enemy to avoid code duplication
-def handle_collision(moving_rect, collision_sprites, direction, direction_vector):
-    for sprite in collision_sprites:
-        if sprite.rect.colliderect(moving_rect):
-            if direction == 'horizontal':
-                if direction_vector.x > 0:
-                    moving_rect.right = sprite.rect.left
-                if direction_vector.x < 0:
-                    moving_rect.left = sprite.rect.right
-            else:
-                if direction_vector.y < 0:
-                    moving_rect.top = sprite.rect.bottom
-                if direction_vector.y > 0:
-                    moving_rect.bottom = sprite.rect.top
+# collision_grid is the SpatialGrid of obstacles built in Game.setup. Obstacles are checked in the same order
+# as the original group, and after every push the grid is asked again from the next obstacle on, since the
+# pushed rect can reach cells that were not looked at before. This gives the same result as checking every
+# obstacle in order.
+def handle_collision(moving_rect, collision_grid, direction, direction_vector):
+    start = 0
+    while True:
+        for index in collision_grid.query(moving_rect, start):
+            sprite = collision_grid.sprites[index]
+            start = index + 1
+            if sprite.rect.colliderect(moving_rect):
+                if direction == 'horizontal':
+                    if direction_vector.x > 0:
+                        moving_rect.right = sprite.rect.left
+                    if direction_vector.x < 0:
+                        moving_rect.left = sprite.rect.right
+                else:
+                    if direction_vector.y < 0:
+                        moving_rect.top = sprite.rect.bottom
+                    if direction_vector.y > 0:
+                        moving_rect.bottom = sprite.rect.top
+                break
+        else:
+            return